@@ -0,0 +1,81 @@
+import React from 'react';
+
+// One colour per score, in the order the server lists `scores` (5 down to 1)
+const SCORE_COLORS = ['#440154', '#3b528b', '#21918c', '#5ec962', '#fde725'];
+
+const WIDTH = 720;
+const HEIGHT = 320;
+const MARGIN = { top: 20, right: 20, bottom: 70, left: 44 };
+
+const wrapLabel = (label, width = 18) => {
+  const lines = [];
+  let line = '';
+  label.split(' ').forEach((word) => {
+    if (line && (line + ' ' + word).length > width) {
+      lines.push(line);
+      line = word;
+    } else {
+      line = line ? `${line} ${word}` : word;
+    }
+  });
+  if (line) lines.push(line);
+  return lines.slice(0, 3);
+};
+
+// Grouped bar chart of one category's summary table from /chart-data, drawn in the browser
+const RatingsChart = ({ title, category, scores }) => {
+  const plotWidth = WIDTH - MARGIN.left - MARGIN.right;
+  const plotHeight = HEIGHT - MARGIN.top - MARGIN.bottom;
+  const maxCount = Math.max(1, ...category.counts.flat());
+  const slot = plotWidth / category.questions.length;
+  const barWidth = (slot * 0.8) / scores.length;
+  const y = (count) => plotHeight - (count / maxCount) * plotHeight;
+
+  return (
+    <figure className="ratings-chart">
+      <figcaption>{title}</figcaption>
+      <svg viewBox={`0 0 ${WIDTH} ${HEIGHT}`} role="img" aria-label={title}>
+        <g transform={`translate(${MARGIN.left},${MARGIN.top})`}>
+          {[0, 0.25, 0.5, 0.75, 1].map((tick) => (
+            <g key={tick}>
+              <line x1={0} x2={plotWidth} y1={y(tick * maxCount)} y2={y(tick * maxCount)} className="grid-line" />
+              <text x={-6} y={y(tick * maxCount)} dy="0.32em" textAnchor="end" className="axis-label">
+                {Math.round(tick * maxCount)}
+              </text>
+            </g>
+          ))}
+          {category.questions.map((question, q) => (
+            <g key={question} transform={`translate(${q * slot + slot * 0.1},0)`}>
+              {category.counts[q].map((count, s) => (
+                <rect
+                  key={scores[s]}
+                  x={s * barWidth}
+                  y={y(count)}
+                  width={barWidth - 1}
+                  height={plotHeight - y(count)}
+                  fill={SCORE_COLORS[s % SCORE_COLORS.length]}
+                >
+                  <title>{`${question}: ${count} × ${scores[s]} (${category.percents[q][s]}%)`}</title>
+                </rect>
+              ))}
+              <text x={slot * 0.4} y={plotHeight + 16} textAnchor="middle" className="axis-label">
+                {wrapLabel(question).map((line, i) => (
+                  <tspan key={i} x={slot * 0.4} dy={i === 0 ? 0 : '1.1em'}>{line}</tspan>
+                ))}
+              </text>
+            </g>
+          ))}
+        </g>
+      </svg>
+      <div className="chart-legend">
+        {scores.map((score, s) => (
+          <span key={score}>
+            <i style={{ background: SCORE_COLORS[s % SCORE_COLORS.length] }} /> {score}
+          </span>
+        ))}
+      </div>
+    </figure>
+  );
+};
+
+export default RatingsChart;
@@ -1,5 +1,6 @@
 import React, { useState, useRef } from 'react';
 import './Report.css';
+import RatingsChart from './RatingsChart';
 
 const Report = () => {
   const fileInputRef = useRef(null);
@@ -7,9 +8,10 @@ const Report = () => {
   const [isUploading, setIsUploading] = useState(false);
   const [fileHeaders, setFileHeaders] = useState([]);
   const [uploadedFilename, setUploadedFilename] = useState('');
+  const [fileId, setFileId] = useState(''); // id of the stored upload; later requests send it instead of the file
   const [feedbackType, setFeedbackType] = useState('stakeholder'); // New state for feedback type
   const [reportType, setReportType] = useState('generalized');
-  const [chartUrls, setChartUrls] = useState([]);
+  const [chartData, setChartData] = useState(null); // summary tables from /chart-data, drawn by RatingsChart
   const [isGenerating, setIsGenerating] = useState(false);
 
   const handleFeedbackTypeChange = (type) => {
@@ -17,8 +19,9 @@ const Report = () => {
     // Reset other states when feedback type changes
     setFileHeaders([]);
     setUploadedFilename('');
+    setFileId('');
     setUploadStatus(null);
-    setChartUrls([]);
+    setChartData(null);
     if (fileInputRef.current) {
       fileInputRef.current.value = '';
     }
@@ -28,7 +31,8 @@ const Report = () => {
     const file = event.target.files[0];
     if (!file) return;
 
-    setChartUrls([]);
+    setChartData(null);
+    setFileId('');
     setIsUploading(true);
     setUploadStatus({ type: 'loading', message: 'Uploading file...' });
 
@@ -59,6 +63,7 @@ const Report = () => {
       
       const uploadData = await uploadResponse.json();
       setUploadedFilename(uploadData.filename);
+      setFileId(uploadData.file_id);
 
       // --- Headers Request ---
       const headersResponse = await fetch(`http://localhost:5001/headers/${uploadData.filename}`);
@@ -86,19 +91,19 @@ const Report = () => {
     setReportType(type);
   };
 
-  const isValid = fileHeaders.length > 0;
+  const isValid = fileHeaders.length > 0 && fileId !== '';
 
   const handleGenerate = async (e) => {
     e.preventDefault();
-    if (!isValid || !fileInputRef.current.files[0]) return;
+    if (!isValid) return;
 
     setIsGenerating(true);
-    setChartUrls([]);
+    setChartData(null);
     setUploadStatus({ type: 'loading', message: 'Generating report...' });
 
     try {
       const formData = new FormData();
-      formData.append('file', fileInputRef.current.files[0]);
+      formData.append('fileId', fileId); // The server reads the stored upload; the file is not sent again
       formData.append('choice', reportType === 'fieldwise' ? "2" : "1");
       formData.append('feedbackType', feedbackType); // Send feedback type to backend
 
@@ -131,22 +136,20 @@ const Report = () => {
 
   const handleViewCharts = async (e) => {
     e.preventDefault();
-    if (!isValid || !fileInputRef.current.files[0]) return;
+    if (!isValid) return;
 
     setIsGenerating(true);
-    setChartUrls([]);
+    setChartData(null);
     setUploadStatus({ type: 'loading', message: 'Generating charts...' });
 
     try {
-        const formData = new FormData();
-        formData.append('file', fileInputRef.current.files[0]);
-        formData.append('choice', reportType === 'fieldwise' ? "2" : "1");
-        formData.append('feedbackType', feedbackType); // Send feedback type to backend
-
-        const response = await fetch('http://localhost:5001/generate-charts', {
-            method: 'POST',
-            body: formData,
+        // Only the numbers come over the wire, as gzipped JSON; a GET lets the browser
+        // revalidate a chart view it has seen with If-None-Match and get a 304 back
+        const params = new URLSearchParams({
+            choice: reportType === 'fieldwise' ? "2" : "1",
+            feedbackType: feedbackType,
         });
+        const response = await fetch(`http://localhost:5001/chart-data/${fileId}?${params}`);
 
         if (!response.ok) {
             const errorText = await response.text();
@@ -154,8 +157,7 @@ const Report = () => {
         }
 
         const data = await response.json();
-        const urls = data.chart_urls; // ✅ this is the correct field name now
-        setChartUrls(urls);
+        setChartData(data);
         setUploadStatus({ type: 'success', message: 'Charts generated successfully!' });
 
 
@@ -287,15 +289,21 @@ const Report = () => {
       )}
 
       {/* Step 5: Display Charts (Step number adjusts based on feedback type) */}
-      {chartUrls.length > 0 && (
+      {chartData && (
         <div className="step-section">
           <h2>Generated Charts</h2>
           <div className="charts-container">
-            {chartUrls.map((url, index) => (
-              <div key={index} className="chart-item">
-                <img src={url} alt={`Generated chart ${index + 1}`} />
-              </div>
-            ))}
+            {chartData.groups.flatMap((group) =>
+              group.categories.map((category) => (
+                <div key={`${group.group}-${category.category}`} className="chart-item">
+                  <RatingsChart
+                    title={`${category.category} Ratings - ${chartData.group_column ? `${chartData.group_column} ${group.group}` : group.group}`}
+                    category={category}
+                    scores={chartData.scores}
+                  />
+                </div>
+              ))
+            )}
           </div>
         </div>
       )}
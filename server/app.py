@@ -1,33 +1,87 @@
-from flask import Flask, request, send_file, jsonify, send_from_directory
+from flask import Flask, Response, g, request, send_file, jsonify
 from flask_cors import CORS
-import os, pandas as pd
-from feedback_processor import process_feedback, process_for_charts
-import matplotlib.pyplot as plt
+import os
+import time, gzip, hashlib, json
+from datetime import datetime, timezone
+import telemetry  # registers the MongoDB command timer before any client is created
+from feedback_processor import (stream_feedback, process_for_charts, aggregate_csv_stream, should_stream,
+                                append_feedback, stream_dataset_reports, chart_data, CATEGORY_DETECTORS,
+                                DEFAULT_CATEGORY_DETECTOR)
+import jobs, result_cache, llm_cache, dataset_profile, columnar_store, uploads, chart_store, profiling, histogram_store
+from summarizers import SUMMARIZER_BACKENDS, DEFAULT_SUMMARIZER
 import re
 from pymongo import MongoClient
 import gridfs
 from io import BytesIO
-import tempfile
 from flask import url_for  
+from werkzeug.wsgi import wrap_file
+from spreadsheet_reader import read_spreadsheet, read_headers
 
 
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}})
+CORS(app, resources={r"/*": {"origins": "http://localhost:5173"}}, expose_headers=['Server-Timing', 'ETag'])
 
 # MongoDB setup
 client = MongoClient('mongodb://localhost:27017/')  
 db = client['feedback_db']  
 files_collection = db['files'] 
-charts_collection = db['charts']
 fs_files = gridfs.GridFS(db, collection='files')  
-fs_charts = gridfs.GridFS(db, collection='charts')
+
+app.config['MAX_CONTENT_LENGTH'] = uploads.MAX_UPLOAD_BYTES + 64 * 1024  # leeway for the multipart envelope
+
+# Per-request stage breakdown as a Server-Timing header: on every response, or
+# only when the request sends `X-Timing: 1`
+TIMING_HEADER_ALWAYS = os.environ.get('TIMING_HEADER', '0') == '1'
+
+@app.before_request
+def start_request_timing():
+    g.timing_token = telemetry.start_trace()
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request_timing(response):
+    if 'timing_token' not in g:
+        return response
+    seconds = time.perf_counter() - g.started
+    trace = telemetry.end_trace(g.pop('timing_token'))
+    # The URL rule, not the path, so chart and job ids do not become label values
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = {'endpoint': endpoint, 'method': request.method, 'status': response.status_code}
+    telemetry.observe('feedback_request_seconds', seconds, **labels)
+    telemetry.increment('feedback_requests_total', **labels)
+    if TIMING_HEADER_ALWAYS or request.headers.get('X-Timing') == '1':
+        entries = [f"total;dur={seconds * 1000:.1f}", telemetry.server_timing(trace)]
+        response.headers['Server-Timing'] = ", ".join(entry for entry in entries if entry)
+    return response
 
 def sanitize_filename(name):
     return re.sub(r'[^A-Za-z0-9_]+', '_', name)
 
+def _profile_upload(file_id, filename, content_hash):
+    # Parse and profile the dataset once per distinct content; report and chart
+    # requests for it read the columnar copy and skip both steps
+    grid_out = fs_files.get(file_id)
+    if should_stream(grid_out, filename):
+        # Too large to load whole: profile it in chunks, requests for it stream too
+        profile = aggregate_csv_stream(grid_out).profile
+    else:
+        df = read_spreadsheet(grid_out, filename)
+        profile = dataset_profile.build_profile(df)
+        columnar_store.store_columnar(content_hash, df)
+    dataset_profile.save_profile(content_hash, profile)
+    return profile
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"File exceeds the {uploads.MAX_UPLOAD_BYTES} byte upload limit"}), 413
+
 # 1) Upload an Excel/CSV and store in MongoDB GridFS
 @app.route('/upload', methods=['POST'])
 def upload_file():
+    # Rejected from Content-Length before any of the body is read
+    if request.content_length and request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return upload_too_large(None)
+
     if 'file' not in request.files:
         return jsonify({"error": "No file uploaded"}), 400
         
@@ -36,25 +90,37 @@ def upload_file():
         return jsonify({"error": "No file selected"}), 400
         
     try:
-        # Read file content
-        file_content = file.read()
-        
-        # Store file in GridFS
-        file_id = fs_files.put(
-            file_content,
-            filename=file.filename,
-            content_type=file.content_type
-        )
-        
-        # Store metadata in files collection
-        files_collection.insert_one({
+        file_id, content_hash, size, duplicate = uploads.store_upload(file.stream, file.filename, file.content_type)
+    except uploads.UploadTooLarge:
+        return upload_too_large(None)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    try:
+        meta = {
             'file_id': file_id,
             'filename': file.filename,
             'content_type': file.content_type,
-            'size': len(file_content)
-        })
-        
-        return jsonify({"filename": file.filename})
+            'size': size,
+            'sha256': content_hash,
+            'uploaded_at': datetime.now(timezone.utc)
+        }
+        # Headers and row count are cached on the document so /headers is a single indexed lookup
+        same_content = files_collection.find_one({'sha256': content_hash, 'headers': {'$exists': True}})
+        if duplicate and same_content and dataset_profile.load_profile(content_hash):
+            meta.update(headers=same_content['headers'], rows=same_content.get('rows'))
+        else:
+            try:
+                profile = _profile_upload(file_id, file.filename, content_hash)
+                meta.update(headers=list(profile.columns), rows=profile.rows)
+            except Exception as e:
+                print(f"Could not profile {file.filename}: {e}")
+
+        # One document per (file_id, filename): the name now finds this upload, earlier ids keep theirs
+        uploads.record_upload(meta)
+
+        return jsonify({"filename": file.filename, "file_id": str(file_id), "sha256": content_hash,
+                        "duplicate": duplicate})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -62,32 +128,72 @@ def upload_file():
 @app.route('/headers/<filename>', methods=['GET'])
 def get_headers(filename):
     try:
-        # Find file in GridFS
-        file_doc = fs_files.find_one({"filename": filename})
-        if not file_doc:
-            return jsonify({"error": "File not found"}), 404
-            
-        # Read file content
-        file_content = file_doc.read()
-        
-        # Create pandas DataFrame
-        if filename.lower().endswith('.csv'):
-            df = pd.read_csv(BytesIO(file_content))
-        else:
-            df = pd.read_excel(BytesIO(file_content))
-            
-        return jsonify({"headers": list(df.columns)})
+        # Headers cached at upload time
+        meta = uploads.find_file_meta(filename)
+        if meta and meta.get('headers') is not None:
+            return jsonify({"headers": meta['headers']})
+
+        # Otherwise the columnar copy's schema, or the file's first row read from GridFS
+        headers = columnar_store.stored_columns(meta.get('sha256')) if meta else None
+        if headers is None:
+            file_doc = fs_files.get(meta['file_id']) if meta else fs_files.find_one({"filename": filename})
+            if not file_doc:
+                return jsonify({"error": "File not found"}), 404
+            headers = read_headers(file_doc, filename)
+
+        if meta:
+            files_collection.update_one({'_id': meta['_id']}, {'$set': {'headers': headers}})
+        return jsonify({"headers": headers})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _request_upload(file, file_id):
+    """(source, filename, content_hash) for a request naming a stored upload (fileId) or sending the file.
+
+    A stored upload is read lazily from GridFS; source is None if file_id is unknown.
+    A sent file is used as the request's spooled stream, hashed in chunks, so a
+    large CSV is never held in memory whole.
+    """
+    if file_id:
+        meta = uploads.get_upload(file_id)
+        if not meta:
+            return None, None, None
+        return uploads.open_upload(meta), meta['filename'], meta['sha256']
+    return file.stream, file.filename, uploads.hash_stream(file.stream)
+
+def _stream_and_cache(chunks, cache_key, report):
+    # Send each piece of the ZIP as it is produced and copy it into the result cache,
+    # which only gets an entry once the whole archive went out and no group or summary fell back
+    writer = result_cache.report_writer(cache_key)
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+            yield chunk
+    except BaseException:
+        writer.abort()
+        raise
+    if report.degraded:
+        writer.abort()
+    else:
+        result_cache.commit_report(cache_key, writer)
+
+def _profile_capture(endpoint, content_hash, filename, **params):
+    # None unless this request is profiled (profile=1 or sampled); others run unwrapped
+    if not profiling.wanted(request.values.get('profile')):
+        return None
+    return profiling.Capture(endpoint, content_hash=content_hash, upload_filename=filename, params=params)
+
 # 3) Generate the report ZIP using the file from MongoDB + choice + feedback type
 @app.route('/generate-report', methods=['POST'])
 def generate_report():
     file = request.files.get('file')
+    file_id = request.form.get('fileId')
     choice = request.form.get('choice')
     feedback_type = request.form.get('feedbackType', 'stakeholder')
+    summarizer = request.form.get('summarizer', DEFAULT_SUMMARIZER)
+    category_detector = request.form.get('categoryDetector', DEFAULT_CATEGORY_DETECTOR)
 
-    if not file or not choice:
+    if not (file or file_id) or not choice:
         return jsonify({"error": "Missing file or choice"}), 400
 
     if choice not in ['1', '2']:
@@ -96,32 +202,96 @@ def generate_report():
     if feedback_type not in ['stakeholder', 'subject']:
         return jsonify({"error": "Invalid feedback type"}), 400
 
+    if summarizer not in SUMMARIZER_BACKENDS:
+        return jsonify({"error": "Invalid summarizer"}), 400
+
+    if category_detector not in CATEGORY_DETECTORS:
+        return jsonify({"error": "Invalid category detector"}), 400
+
+    capture = None
     try:
-        # Use filename for extension and pass file.stream as file-like object
-        zip_buffer = process_feedback(
-            file_bytes=file.stream,
-            filename=file.filename,
-            choice=choice,
-            feedback_type=feedback_type
-        )
+        source, filename, content_hash = _request_upload(file, file_id)
+        if source is None:
+            return jsonify({"error": "File not found"}), 404
+        capture = _profile_capture('/generate-report', content_hash, filename, choice=choice,
+                                   feedback_type=feedback_type, summarizer=summarizer,
+                                   category_detector=category_detector)
+        cache_key = result_cache.cache_key(content_hash, 'report', choice=choice, feedback_type=feedback_type,
+                                           summarizer=summarizer, category_detector=category_detector)
+        # A profiled request always runs the pipeline; a cache hit would have nothing to profile
+        zip_bytes = None if capture else result_cache.get_report(cache_key)
+        if zip_bytes is not None:
+            return send_file(
+                BytesIO(zip_bytes),
+                as_attachment=True,
+                download_name='feedback_reports.zip',
+                mimetype='application/zip'
+            )
 
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name='feedback_reports.zip',
-            mimetype='application/zip'
+        # Errors in loading or profiling raise here, before any of the response is sent
+        run = capture.run if capture else (lambda fn, **kwargs: fn(**kwargs))
+        report = run(
+            stream_feedback,
+            file_bytes=source,
+            filename=filename,
+            choice=choice,
+            feedback_type=feedback_type,
+            summarizer=summarizer,
+            category_detector=category_detector,
+            content_hash=content_hash
         )
+        headers = {'Content-Disposition': 'attachment; filename=feedback_reports.zip'}
+        chunks = report
+        if capture:
+            # The profile is saved once the last chunk has been produced
+            chunks = capture.iterate(report)
+            headers['X-Profile-Id'] = str(capture.profile_id)
+        return Response(_stream_and_cache(chunks, cache_key, report), mimetype='application/zip', headers=headers)
 
     except Exception as e:
+        if capture:
+            capture.save(e)
         return jsonify({"error": str(e)}), 500
 
+def _chart_data_response(source, filename, content_hash, choice, feedback_type, category_detector):
+    # The summary tables as JSON, gzipped once and cached; GET requests are revalidated by ETag
+    cache_key = result_cache.cache_key(content_hash, 'chart_data', choice=choice, feedback_type=feedback_type,
+                                       category_detector=category_detector)
+    cached = result_cache.get_chart_data(cache_key)
+    body = None
+    if cached is None:
+        data = chart_data(source, choice, feedback_type, category_detector=category_detector,
+                          content_hash=content_hash, filename=filename)
+        body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        gzipped, etag = gzip.compress(body, 6), hashlib.sha256(body).hexdigest()[:32]
+        # Categories from the local detector standing in for Gemini are not cached as Gemini's
+        if data['category_detector'] == category_detector:
+            result_cache.put_chart_data(cache_key, gzipped, etag)
+    else:
+        gzipped, etag = cached
+
+    if request.accept_encodings['gzip']:
+        response = Response(gzipped, mimetype='application/json')
+        response.content_encoding = 'gzip'
+        etag += '-gzip'
+    else:
+        response = Response(body if body is not None else gzip.decompress(gzipped), mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route('/generate-charts', methods=['POST'])
 def generate_charts():
     file = request.files.get('file')
+    file_id = request.form.get('fileId')
     choice = request.form.get('choice')
     feedback_type = request.form.get('feedbackType', 'stakeholder')
+    category_detector = request.form.get('categoryDetector', DEFAULT_CATEGORY_DETECTOR)
+    # 'images' (default): PNGs stored in GridFS, returned as URLs; 'data': the numbers behind them as JSON
+    mode = request.form.get('mode', 'images')
 
-    if not file or not choice:
+    if not (file or file_id) or not choice:
         return jsonify({"error": "Missing file or choice"}), 400
 
     if choice not in ['1', '2']:
@@ -130,15 +300,32 @@ def generate_charts():
     if feedback_type not in ['stakeholder', 'subject']:
         return jsonify({"error": "Invalid feedback type"}), 400
 
-    tmp_file_path = None
-    try:
-        # Save file to a temporary path
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
-            tmp_file_path = tmp_file.name
-            file.save(tmp_file_path)
+    if category_detector not in CATEGORY_DETECTORS:
+        return jsonify({"error": "Invalid category detector"}), 400
 
-        # Generate chart files (filenames already stored in GridFS by plot_ratings)
-        chart_filenames = process_for_charts(tmp_file_path, choice, feedback_type)
+    if mode not in ['images', 'data']:
+        return jsonify({"error": "Invalid mode"}), 400
+
+    capture = None
+    try:
+        source, filename, content_hash = _request_upload(file, file_id)
+        if source is None:
+            return jsonify({"error": "File not found"}), 404
+        if mode == 'data':
+            return _chart_data_response(source, filename, content_hash, choice, feedback_type, category_detector)
+        capture = _profile_capture('/generate-charts', content_hash, filename, choice=choice,
+                                   feedback_type=feedback_type, category_detector=category_detector)
+        cache_key = result_cache.cache_key(content_hash, 'charts', choice=choice, feedback_type=feedback_type,
+                                           category_detector=category_detector)
+        chart_filenames = None if capture else result_cache.get_charts(cache_key, chart_store.charts_exist)
+        if chart_filenames is None:
+            # Generate chart files (filenames already stored in GridFS by plot_ratings)
+            run = capture.run if capture else (lambda fn, *args, **kwargs: fn(*args, **kwargs))
+            chart_filenames, detector = run(process_for_charts, source, choice, feedback_type,
+                                            category_detector=category_detector, content_hash=content_hash,
+                                            filename=filename)
+            if detector == category_detector:
+                result_cache.put_charts(cache_key, chart_filenames)
         print(f"Chart filenames returned: {chart_filenames}")
 
         # Generate URLs to retrieve charts via /charts/<filename>
@@ -147,41 +334,265 @@ def generate_charts():
             for filename in chart_filenames
         ]
 
-        return jsonify({
+        response = jsonify({
             "chart_urls": chart_urls,
             "total_charts": len(chart_urls)
         })
+        if capture:
+            capture.save()
+            response.headers['X-Profile-Id'] = str(capture.profile_id)
+        return response
 
     except Exception as e:
+        if capture:
+            capture.save(e)
         print(f"Error in generate_charts: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        if tmp_file_path and os.path.exists(tmp_file_path):
-            os.unlink(tmp_file_path)
 
+# Chart data of a stored upload by GET, so browsers revalidate it with If-None-Match
+@app.route('/chart-data/<file_id>', methods=['GET'])
+def get_chart_data(file_id):
+    choice = request.args.get('choice', '1')
+    feedback_type = request.args.get('feedbackType', 'stakeholder')
+    category_detector = request.args.get('categoryDetector', DEFAULT_CATEGORY_DETECTOR)
+
+    if choice not in ['1', '2']:
+        return jsonify({"error": "Invalid choice parameter"}), 400
+
+    if feedback_type not in ['stakeholder', 'subject']:
+        return jsonify({"error": "Invalid feedback type"}), 400
+
+    if category_detector not in CATEGORY_DETECTORS:
+        return jsonify({"error": "Invalid category detector"}), 400
+
+    try:
+        source, filename, content_hash = _request_upload(None, file_id)
+        if source is None:
+            return jsonify({"error": "File not found"}), 404
+        return _chart_data_response(source, filename, content_hash, choice, feedback_type, category_detector)
+    except Exception as e:
+        print(f"Error in get_chart_data: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# Incremental reports: each append counts only the new rows of a growing export
+DATASET_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def _report_urls(report):
+    return {**report, 'charts': [url_for('get_chart', filename=name, _external=True) for name in report['charts']]}
+
+@app.route('/datasets/<dataset_id>/append', methods=['POST'])
+def append_dataset(dataset_id):
+    file = request.files.get('file')
+    file_id = request.form.get('fileId')
+    feedback_type = request.form.get('feedbackType', 'stakeholder')
+    summarizer = request.form.get('summarizer', DEFAULT_SUMMARIZER)
+    category_detector = request.form.get('categoryDetector', DEFAULT_CATEGORY_DETECTOR)
+    # '1' (default): the file is the whole export so far; '0': it holds only rows not sent before
+    cumulative = request.form.get('cumulative', '1') != '0'
+
+    if not DATASET_ID_PATTERN.match(dataset_id):
+        return jsonify({"error": "Invalid dataset id"}), 400
+
+    if not (file or file_id):
+        return jsonify({"error": "Missing file"}), 400
+
+    if feedback_type not in ['stakeholder', 'subject']:
+        return jsonify({"error": "Invalid feedback type"}), 400
+
+    if summarizer not in SUMMARIZER_BACKENDS:
+        return jsonify({"error": "Invalid summarizer"}), 400
+
+    if category_detector not in CATEGORY_DETECTORS:
+        return jsonify({"error": "Invalid category detector"}), 400
+
+    try:
+        source, filename, _ = _request_upload(file, file_id)
+        if source is None:
+            return jsonify({"error": "File not found"}), 404
+        result = append_feedback(dataset_id, source, filename, feedback_type, cumulative,
+                                 summarizer=summarizer, category_detector=category_detector)
+        return jsonify({**result, "dataset_id": dataset_id, "groups": [_report_urls(r) for r in result['groups']]})
+    except histogram_store.StaleWatermark as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        print(f"Error in append_dataset: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/datasets/<dataset_id>', methods=['GET'])
+def get_dataset(dataset_id):
+    dataset = histogram_store.get_dataset(dataset_id)
+    if not dataset:
+        return jsonify({"error": "Dataset not found"}), 404
+    return jsonify({
+        "dataset_id": dataset_id,
+        "feedback_type": dataset['feedback_type'],
+        "group_column": dataset['group_column'],
+        "rows": dataset['rows'],
+        "version": dataset['version'],
+        "pending": bool(dataset.get('pending')),
+        "reports": [_report_urls(report) for report in histogram_store.list_reports(dataset_id)]
+    })
+
+@app.route('/datasets/<dataset_id>/reports', methods=['GET'])
+def download_dataset_reports(dataset_id):
+    if not histogram_store.get_dataset(dataset_id):
+        return jsonify({"error": "Dataset not found"}), 404
+    return Response(stream_dataset_reports(dataset_id), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={dataset_id}_reports.zip'})
+
+# 4) Background jobs: submit returns a job id at once, then poll for progress and the result
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    file = request.files.get('file')
+    file_id = request.form.get('fileId')
+    kind = request.form.get('kind', 'report')
+    choice = request.form.get('choice')
+    feedback_type = request.form.get('feedbackType', 'stakeholder')
+    summarizer = request.form.get('summarizer', DEFAULT_SUMMARIZER)
+    category_detector = request.form.get('categoryDetector', DEFAULT_CATEGORY_DETECTOR)
+
+    if not (file or file_id) or not choice:
+        return jsonify({"error": "Missing file or choice"}), 400
+
+    if kind not in jobs.JOB_KINDS:
+        return jsonify({"error": "Invalid job kind"}), 400
+
+    if summarizer not in SUMMARIZER_BACKENDS:
+        return jsonify({"error": "Invalid summarizer"}), 400
+
+    if category_detector not in CATEGORY_DETECTORS:
+        return jsonify({"error": "Invalid category detector"}), 400
+
+    if choice not in ['1', '2']:
+        return jsonify({"error": "Invalid choice parameter"}), 400
+
+    if feedback_type not in ['stakeholder', 'subject']:
+        return jsonify({"error": "Invalid feedback type"}), 400
+
+    # The per-client cap is keyed on the connection's address, not on anything the caller can pick
+    client_id = request.remote_addr
+    try:
+        if file_id:
+            # The worker loads the stored upload itself; only the id is queued
+            meta = uploads.get_upload(file_id)
+            if not meta:
+                return jsonify({"error": "File not found"}), 404
+            job_id = jobs.submit_job(kind, client_id, None, meta['filename'], choice, feedback_type,
+                                     summarizer, category_detector, file_id=str(meta['file_id']))
+        else:
+            job_id = jobs.submit_job(kind, client_id, file.stream, file.filename, choice, feedback_type,
+                                     summarizer, category_detector)
+        return jsonify({
+            "job_id": job_id,
+            "status_url": url_for('get_job_status', job_id=job_id, _external=True)
+        }), 202
+    except jobs.JobLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] != 'done':
+        return jsonify({"error": f"Job is {job['status']}", "status": job['status']}), 409
+
+    try:
+        if job['kind'] == 'report':
+            return send_file(
+                BytesIO(jobs.get_job_result(job).read()),
+                as_attachment=True,
+                download_name='feedback_reports.zip',
+                mimetype='application/zip'
+            )
+
+        chart_urls = [
+            url_for('get_chart', filename=filename, _external=True)
+            for filename in job['chart_filenames']
+        ]
+        return jsonify({
+            "chart_urls": chart_urls,
+            "total_charts": len(chart_urls)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = jobs.cancel_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+# Profiling and metrics: captured request profiles and Prometheus counters
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify({"profiles": profiling.list_profiles(limit)})
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    grid_out = profiling.open_profile(profile_id)
+    if not grid_out:
+        return jsonify({"error": "Profile not found"}), 404
+    if request.args.get('format') == 'text':
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in profiling.SORT_KEYS:
+            return jsonify({"error": f"sort must be one of {', '.join(profiling.SORT_KEYS)}"}), 400
+        return Response(profiling.profile_text(grid_out, sort), mimetype='text/plain')
+    return send_file(grid_out, as_attachment=True, download_name=f"{profile_id}.pstats",
+                     mimetype='application/octet-stream')
+
+@app.route('/metrics')
+def metrics():
+    return Response(telemetry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+# 5) Gemini answer cache: hit/miss counters and manual invalidation
+@app.route('/llm-cache', methods=['GET'])
+def get_llm_cache_stats():
+    return jsonify(llm_cache.stats())
+
+@app.route('/llm-cache', methods=['DELETE'])
+def invalidate_llm_cache():
+    namespace = request.args.get('namespace')
+    return jsonify({"deleted": llm_cache.invalidate(namespace)})
 
 @app.route('/charts/<filename>')
 def get_chart(filename):
     try:
-        print(f"Looking for chart with filename: {filename}")  # Add logging
-        
-        # Find chart in GridFS by filename
-        chart_doc = fs_charts.find_one({"filename": filename})
-        if not chart_doc:
-            print(f"Chart not found for filename: {filename}")  # Add logging
+        chart = chart_store.serve_chart(filename)
+        if not chart:
             return jsonify({"error": "Chart not found"}), 404
-            
-        print(f"Found chart for filename: {filename}")  # Add logging
-        
-        # Return chart content
-        return send_file(
-            BytesIO(chart_doc.read()),
-            mimetype='image/png',
-            as_attachment=False
-        )
+
+        if chart.data is not None:
+            response = Response(chart.data, mimetype='image/png')
+        else:
+            # Read one GridFS chunk per block; a seekable body lets ranges skip straight to their offset
+            body = wrap_file(request.environ, chart.grid_out, buffer_size=chart.grid_out.chunk_size)
+            response = Response(body, mimetype='image/png', direct_passthrough=True)
+            response.content_length = chart.size
+        response.set_etag(chart.etag)
+        response.last_modified = chart.created_at
+        if chart.immutable:
+            response.cache_control.public = True
+            response.cache_control.max_age = 365 * 24 * 3600
+            response.cache_control.immutable = True
+        else:
+            # Unscoped names can be overwritten: revalidate every time
+            response.cache_control.no_cache = True
+        return response.make_conditional(request, accept_ranges=True, complete_length=chart.size)
     except Exception as e:
-        print(f"Error in get_chart: {str(e)}")  # Add logging
+        print(f"Error in get_chart: {str(e)}")
         return jsonify({"error": str(e)}), 500
         
 if __name__ == '__main__':
@@ -0,0 +1,246 @@
+"""
+Offline benchmark of the report pipeline.
+
+Generates a synthetic feedback sheet and times each stage of a grouped
+report run on its own: parse, normalize, Likert detection, histograms and
+summary tables, suggestion summaries, plot_ratings, PDF layout and ZIP,
+plus process_feedback end to end. MongoDB is replaced by mongomock
+(in-process, `pip install mongomock`) and Gemini by a local fake model, so
+no network is touched. Results are written as JSON; pass an earlier result
+as --baseline to flag stages that got slower.
+
+    python benchmark.py --rows 20000 --likert-columns 12 --groups 8 --format xlsx --output bench.json
+"""
+import os, sys, json, time, random, argparse, platform, contextlib, statistics
+from datetime import datetime, timezone
+from io import BytesIO
+import numpy as np
+import pandas as pd
+
+CATEGORY_NAMES = ['Curriculum', 'Faculty', 'Facilities', 'Library', 'Placement', 'Infrastructure',
+                  'Administration', 'Laboratories', 'Sports', 'Hostel']
+SUGGESTION_WORDS = ('more practical labs better wifi library hours faculty support clear syllabus timely '
+                    'feedback projects industry visits cleaner canteen workshops seminars notes online '
+                    'resources mentoring placements assessments').split()
+STAGES = ['parse', 'normalize', 'likert_detection', 'summary_tables', 'summaries', 'plot_ratings',
+          'pdf_layout', 'zip', 'end_to_end']
+
+def generate_feedback(rows=5000, likert_columns=9, categories=3, groups=5, suggestion_words=12, seed=0):
+    """Synthetic stakeholder sheet: Name, Branch, `Category [Question n]` answers 1-5 (5% blank) and suggestions."""
+    rng = np.random.default_rng(seed)
+    words = random.Random(seed)
+    data = {
+        'Name': [f"Student {i}" for i in range(rows)],
+        'Branch': rng.choice([f"Branch {i}" for i in range(groups)], rows),
+    }
+    for i in range(likert_columns):
+        category = CATEGORY_NAMES[i % categories] if i % categories < len(CATEGORY_NAMES) else f"Category {i % categories}"
+        answers = rng.integers(1, 6, rows).astype(float)
+        answers[rng.random(rows) < 0.05] = np.nan
+        data[f"{category} [Question {i // categories + 1}]"] = answers
+    data['Any suggestions?'] = [
+        ' '.join(words.choices(SUGGESTION_WORDS, k=suggestion_words)).capitalize() if words.random() < 0.7 else None
+        for _ in range(rows)
+    ]
+    return pd.DataFrame(data)
+
+def encode_feedback(df, fmt='csv'):
+    """(bytes, filename) of df written as CSV or XLSX."""
+    buffer = BytesIO()
+    if fmt == 'xlsx':
+        df.to_excel(buffer, index=False, engine='openpyxl')
+    else:
+        df.to_csv(buffer, index=False)
+    return buffer.getvalue(), f"benchmark.{fmt}"
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGeminiModel:
+    """Stands in for genai.GenerativeModel: canned category maps and summaries after `latency` seconds."""
+    def __init__(self, columns, latency=0.0):
+        self.category_map = {col: col.split('[')[0].strip() for col in columns if '[' in col}
+        self.latency = latency
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if 'JSON' in prompt:
+            return FakeResponse(json.dumps(self.category_map))
+        return FakeResponse("Students ask for more practical sessions and better library access.")
+
+def _use_mongomock():
+    # Must run before any server module is imported: they connect at import time
+    try:
+        import mongomock, mongomock.gridfs, mongomock.store
+    except ImportError:
+        sys.exit("benchmark.py needs mongomock for its in-process MongoDB (pip install mongomock)")
+    import pymongo
+    store = mongomock.store.ServerStore()
+
+    class SharedClient(mongomock.MongoClient):
+        # One store for every module's client, like a single mongod
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault('_store', store)
+            super().__init__(*args, **kwargs)
+
+    pymongo.MongoClient = SharedClient
+    mongomock.gridfs.enable_gridfs_integration()
+    return SharedClient()
+
+def _versions():
+    versions = {'python': platform.python_version()}
+    for name in ['numpy', 'pandas', 'matplotlib', 'fpdf', 'pyarrow', 'openpyxl']:
+        try:
+            versions[name] = getattr(__import__(name), '__version__', 'unknown')
+        except ImportError:
+            versions[name] = None
+    return versions
+
+def run_once(data, filename, feedback_type, fp):
+    """Time every stage once on the encoded sheet; returns {stage: seconds}."""
+    from spreadsheet_reader import read_spreadsheet
+    from dataset_profile import build_profile, normalize_frame
+
+    timings = {}
+
+    @contextlib.contextmanager
+    def stage(name):
+        start = time.perf_counter()
+        yield
+        timings[name] = time.perf_counter() - start
+
+    with stage('parse'):
+        df = read_spreadsheet(data, filename)
+    with stage('likert_detection'):
+        profile = build_profile(df)
+        category_groups, _ = fp.get_category_groups(df, profile, feedback_type, 'gemini')
+    with stage('normalize'):
+        df = normalize_frame(df, profile)
+
+    group_col = profile.group_column
+    with stage('summary_tables'):
+        histogram = fp.compute_likert_histograms(df, category_groups, group_col, profile)
+        values = sorted(df[group_col].dropna().unique())
+        tables = []
+        for value in values:
+            group_histogram = fp.histogram_for_group(histogram, value)
+            for category, cols in category_groups.items():
+                table = fp.generate_summary_table(df, cols, feedback_type, group_histogram)
+                if not table.empty:
+                    tables.append((value, category, table))
+
+    summaries = {}
+    with stage('summaries'):
+        suggestion_col = next((col for col in df.columns if 'suggestion' in col.lower()), None)
+        if feedback_type == 'stakeholder' and suggestion_col:
+            positions = fp.group_positions(df[group_col])
+            summaries = fp.summarize_suggestions_for_groups(
+                [(value, df[suggestion_col].iloc[rows].to_frame()) for value, rows in positions.items()],
+                suggestion_col, 'gemini'
+            )
+
+    with stage('plot_ratings'):
+        for value, category, table in tables:
+            fp.plot_ratings(table, category, f"{group_col}_{value}", feedback_type)
+
+    frame = df.iloc[:0]
+    with stage('pdf_layout'):
+        reports = [
+            fp._build_group_report(feedback_type, group_col, value, frame, category_groups,
+                                   fp.histogram_for_group(histogram, value), summaries.get(value))
+            for value in values
+        ]
+
+    with stage('zip'):
+        b"".join(fp._zip_stream((value, report, None) for value, report in zip(values, reports)))
+
+    with stage('end_to_end'):
+        fp.process_feedback(data, filename, '2', feedback_type, workers=1, summarizer='gemini', category_detector='gemini')
+    return timings
+
+def compare(result, baseline, tolerance):
+    """Stages whose median is more than `tolerance` times the baseline's: {stage: ratio}."""
+    slower = {}
+    for name, stats in result['stages'].items():
+        before = baseline.get('stages', {}).get(name)
+        if before and before['median'] > 0 and stats['median'] / before['median'] > tolerance:
+            slower[name] = round(stats['median'] / before['median'], 3)
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--likert-columns', type=int, default=9)
+    parser.add_argument('--categories', type=int, default=3)
+    parser.add_argument('--groups', type=int, default=5)
+    parser.add_argument('--suggestion-words', type=int, default=12)
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+    parser.add_argument('--feedback-type', choices=['stakeholder', 'subject'], default='stakeholder')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--gemini-latency', type=float, default=0.0, help='seconds the fake model takes per call')
+    parser.add_argument('--output', help='write the JSON result here instead of stdout')
+    parser.add_argument('--baseline', help='earlier JSON result to compare medians against')
+    parser.add_argument('--tolerance', type=float, default=1.2, help='slowdown ratio that counts as a regression')
+    args = parser.parse_args(argv)
+
+    client = _use_mongomock()
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    # Report chart copies would only add GridFS writes on a background thread
+    os.environ['REPORT_CHART_STORE'] = 'off'
+    os.environ['CHART_SWEEP_INTERVAL_SECONDS'] = '0'
+    # The pipeline's own logging goes to stderr so stdout stays valid JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        import feedback_processor as fp
+
+        df = generate_feedback(args.rows, args.likert_columns, args.categories, args.groups,
+                               args.suggestion_words, args.seed)
+        data, filename = encode_feedback(df, args.format)
+        fp.model = FakeGeminiModel(df.columns, args.gemini_latency)
+
+        runs = []
+        for i in range(args.repeat):
+            # Fresh database each run, so LLM and chart caches never carry over
+            client.drop_database('feedback_db')
+            runs.append(run_once(data, filename, args.feedback_type, fp))
+            print(f"run {i + 1}/{args.repeat}: {sum(runs[-1].values()) - runs[-1]['end_to_end']:.2f}s staged, "
+                  f"{runs[-1]['end_to_end']:.2f}s end to end")
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'tolerance')}
+    result = {
+        'benchmark': 'report_pipeline',
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'config': {**config, 'input_bytes': len(data)},
+        'environment': {**_versions(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'stages': {
+            name: {
+                'runs': [round(run[name], 6) for run in runs],
+                'median': round(statistics.median(run[name] for run in runs), 6),
+                'min': round(min(run[name] for run in runs), 6),
+            }
+            for name in STAGES
+        },
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            result['regressions'] = compare(result, json.load(f), args.tolerance)
+        for name, ratio in result['regressions'].items():
+            print(f"{name} is {ratio}x slower than the baseline", file=sys.stderr)
+        exit_code = 1 if result['regressions'] else 0
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Stored chart images.
+
+Charts drawn for /generate-charts and chart jobs are kept in the `charts`
+GridFS bucket under names qualified by the upload's SHA-256 and the job (or
+request) that drew them, so two users' charts never share a filename. The
+`charts` collection holds one metadata row per chart, indexed on filename,
+dataset and creation time; charts are kept for CHART_RETENTION_SECONDS and
+a background sweep deletes expired blobs (and their chunks) every
+CHART_SWEEP_INTERVAL_SECONDS. Pinned charts (those of an incrementally
+updated dataset's current reports) never expire; their owner deletes them
+with delete_charts once they are replaced.
+"""
+import os, time, uuid, hashlib, threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient, ASCENDING, DESCENDING
+import gridfs
+from telemetry import span
+
+# MongoDB setup
+client = MongoClient('mongodb://localhost:27017/')
+db = client['feedback_db']
+charts_collection = db['charts']
+fs_charts = gridfs.GridFS(db, collection='charts')
+
+CHART_RETENTION_SECONDS = int(os.environ.get('CHART_RETENTION_SECONDS', str(7 * 24 * 3600)))
+CHART_SWEEP_INTERVAL_SECONDS = int(os.environ.get('CHART_SWEEP_INTERVAL_SECONDS', '3600'))
+# In-process LRU of recently served scoped charts, which never change once stored
+CHART_LRU_BYTES = int(os.environ.get('CHART_LRU_BYTES', str(32 * 1024 * 1024)))
+CHART_LRU_ITEM_BYTES = 1024 * 1024
+
+_indexes_ready = False
+_sweeper = None
+_hot = OrderedDict()
+_hot_bytes = 0
+_hot_lock = threading.Lock()
+
+@dataclass
+class ChartScope:
+    """Who a stored chart belongs to: the upload's SHA-256 and the job (or request) that drew it."""
+    dataset: str = None
+    job: str = None
+    pinned: bool = False  # kept until delete_charts, not swept
+
+    @classmethod
+    def new(cls, dataset=None, job=None):
+        return cls(dataset, str(job) if job else uuid.uuid4().hex[:12])
+
+    def filename(self, base):
+        return f"{(self.dataset or 'upload')[:12]}_{self.job}_{base}"
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def _ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        charts_collection.create_index([('filename', ASCENDING), ('created_at', DESCENDING)])
+        charts_collection.create_index('dataset')
+        charts_collection.create_index('created_at')
+        charts_collection.create_index('expires_at')
+        charts_collection.create_index('chart_id')
+        _indexes_ready = True
+
+def store_chart(filename, png_bytes, scope=None):
+    """Save a PNG under filename. Unscoped charts replace any earlier chart of the same name."""
+    _ensure_indexes()
+    _start_sweeper()
+    previous = [] if scope else list(charts_collection.find({'filename': filename}, {'chart_id': 1, 'filename': 1}))
+    with span('chart_store', charts=1, bytes=len(png_bytes)):
+        chart_id = fs_charts.put(png_bytes, filename=filename, content_type='image/png')
+    now = _now()
+    charts_collection.insert_one({
+        'chart_id': chart_id,
+        'filename': filename,
+        'content_type': 'image/png',
+        'size': len(png_bytes),
+        'sha256': hashlib.sha256(png_bytes).hexdigest(),
+        'dataset': scope.dataset if scope else None,
+        'job': scope.job if scope else None,
+        'created_at': now,
+        'expires_at': None if scope and scope.pinned else now + timedelta(seconds=CHART_RETENTION_SECONDS)
+    })
+    for doc in previous:
+        _delete_chart(doc)
+
+@dataclass
+class ServedChart:
+    """A chart ready to send: data (bytes from the LRU) or grid_out (to stream), plus its validators."""
+    etag: str
+    size: int
+    created_at: datetime = None
+    immutable: bool = False
+    data: bytes = None
+    grid_out: object = None
+
+def _hot_get(filename):
+    with _hot_lock:
+        chart = _hot.get(filename)
+        if chart:
+            _hot.move_to_end(filename)
+        return chart
+
+def _hot_put(filename, chart):
+    global _hot_bytes
+    with _hot_lock:
+        if filename in _hot:
+            return
+        _hot[filename] = chart
+        _hot_bytes += chart.size
+        while _hot_bytes > CHART_LRU_BYTES:
+            _, evicted = _hot.popitem(last=False)
+            _hot_bytes -= evicted.size
+
+def serve_chart(filename):
+    """Look up a chart for /charts: a ServedChart, or None if there is none.
+
+    The ETag is the stored SHA-256 (GridFS md5 or the blob id for charts
+    stored before that). Scoped charts are immutable; small ones are kept in
+    the LRU so a burst of requests for them reads GridFS once.
+    """
+    chart = _hot_get(filename)
+    if chart:
+        return chart
+    _ensure_indexes()
+    doc = charts_collection.find_one({'filename': filename}, sort=[('created_at', DESCENDING)]) or {}
+    grid_out = None
+    if doc.get('chart_id'):
+        try:
+            grid_out = fs_charts.get(doc['chart_id'])
+        except gridfs.errors.NoFile:
+            pass
+    if grid_out is None:
+        # Charts stored before metadata carried created_at
+        doc, grid_out = {}, fs_charts.find_one({'filename': filename})
+        if grid_out is None:
+            return None
+    chart = ServedChart(
+        etag=doc.get('sha256') or getattr(grid_out, 'md5', None) or str(grid_out._id),
+        size=grid_out.length,
+        created_at=doc.get('created_at') or grid_out.upload_date,
+        immutable=bool(doc.get('job')),
+        grid_out=grid_out
+    )
+    if chart.immutable and chart.size <= CHART_LRU_ITEM_BYTES:
+        chart.data, chart.grid_out = grid_out.read(), None
+        _hot_put(filename, chart)
+    return chart
+
+def charts_exist(filenames):
+    _ensure_indexes()
+    found = charts_collection.distinct('filename', {'filename': {'$in': list(filenames)}})
+    return len(set(found)) == len(set(filenames))
+
+def _delete_chart(doc):
+    # GridFS.delete removes the file document and all its chunks
+    global _hot_bytes
+    if doc.get('chart_id'):
+        fs_charts.delete(doc['chart_id'])
+    charts_collection.delete_one({'_id': doc['_id']})
+    with _hot_lock:
+        chart = _hot.pop(doc.get('filename'), None)
+        if chart:
+            _hot_bytes -= chart.size
+
+def delete_charts(filenames):
+    """Delete the stored charts called any of filenames; returns how many."""
+    _ensure_indexes()
+    deleted = 0
+    for doc in charts_collection.find({'filename': {'$in': list(filenames)}}, {'chart_id': 1, 'filename': 1}):
+        _delete_chart(doc)
+        deleted += 1
+    return deleted
+
+def sweep_charts():
+    """Delete charts past their retention (and rows from before retention was recorded); returns how many."""
+    _ensure_indexes()
+    cutoff = _now()
+    expired = charts_collection.find(
+        {'$or': [{'expires_at': {'$lte': cutoff}}, {'expires_at': {'$exists': False}}]},
+        {'chart_id': 1, 'filename': 1}
+    )
+    deleted = 0
+    for doc in expired:
+        _delete_chart(doc)
+        deleted += 1
+    # Blobs whose metadata row was never written or is already gone
+    stale = cutoff - timedelta(seconds=CHART_RETENTION_SECONDS)
+    for blob in fs_charts.find({'uploadDate': {'$lt': stale.replace(tzinfo=None)}}):
+        if not charts_collection.find_one({'chart_id': blob._id}, {'_id': 1}):
+            fs_charts.delete(blob._id)
+            deleted += 1
+    if deleted:
+        print(f"Chart sweep deleted {deleted} expired charts")
+    return deleted
+
+def _sweep_forever():
+    while True:
+        try:
+            sweep_charts()
+        except Exception as e:
+            print(f"Chart sweep failed: {e}")
+        time.sleep(CHART_SWEEP_INTERVAL_SECONDS)
+
+def _start_sweeper():
+    global _sweeper
+    if _sweeper is None and CHART_SWEEP_INTERVAL_SECONDS > 0:
+        _sweeper = threading.Thread(target=_sweep_forever, name='chart-sweep', daemon=True)
+        _sweeper.start()
@@ -0,0 +1,135 @@
+"""
+Parse-once columnar copies of uploads.
+
+/upload converts the spreadsheet once into an uncompressed Arrow IPC (Feather
+v2) file stored in the `columnar` GridFS bucket under the upload's SHA-256.
+Later requests read it back with column projection, memory-mapped from a
+local copy in COLUMNAR_CACHE_DIR, instead of re-parsing the spreadsheet.
+The local copies are an LRU bounded by COLUMNAR_CACHE_MAX_BYTES (a file's
+mtime is its last use); delete_columnar drops both copies once no stored
+upload has that content any more.
+"""
+import os, tempfile
+from io import BytesIO
+import pandas as pd
+from pymongo import MongoClient
+import gridfs
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # without pyarrow every request falls back to parsing the upload
+    pa = None
+
+COLUMNAR_AVAILABLE = pa is not None
+
+# MongoDB setup
+client = MongoClient('mongodb://localhost:27017/')
+db = client['feedback_db']
+fs_columnar = gridfs.GridFS(db, collection='columnar')
+
+COLUMNAR_CACHE_DIR = os.environ.get('COLUMNAR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'feedback_columnar'))
+COLUMNAR_CACHE_MAX_BYTES = int(os.environ.get('COLUMNAR_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+
+def _local_path(content_hash):
+    return os.path.join(COLUMNAR_CACHE_DIR, f"{content_hash}.arrow")
+
+def _arrow_table(df):
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object:
+            try:
+                pa.array(df[col], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # Mixed text/number answers: keep them as text, the profile re-coerces numbers
+                df[col] = df[col].map(lambda x: x if pd.isna(x) else str(x))
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def store_columnar(content_hash, df):
+    """Save df as Arrow IPC in GridFS (and the local cache); no-op if already stored."""
+    if pa is None or fs_columnar.exists({'filename': f"{content_hash}.arrow"}):
+        return
+    buffer = BytesIO()
+    feather.write_feather(_arrow_table(df), buffer, compression='uncompressed')
+    data = buffer.getvalue()
+    fs_columnar.put(data, filename=f"{content_hash}.arrow", content_type='application/vnd.apache.arrow.file',
+                    sha256=content_hash, rows=len(df), columns=[str(col) for col in df.columns])
+    _write_local(content_hash, data)
+
+def _write_local(content_hash, data):
+    os.makedirs(COLUMNAR_CACHE_DIR, exist_ok=True)
+    # Write then rename so a concurrent reader never maps a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=COLUMNAR_CACHE_DIR, suffix='.part')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, _local_path(content_hash))
+    _trim_local(keep=_local_path(content_hash))
+
+def _trim_local(keep=None):
+    # Least recently used copies go first; a reader that still maps a deleted file keeps its pages
+    entries = []
+    for entry in os.scandir(COLUMNAR_CACHE_DIR):
+        if entry.name.endswith('.arrow'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= COLUMNAR_CACHE_MAX_BYTES:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def _local_copy(content_hash):
+    path = _local_path(content_hash)
+    if not os.path.exists(path):
+        blob = fs_columnar.find_one({'filename': f"{content_hash}.arrow"})
+        if not blob:
+            return None
+        _write_local(content_hash, blob.read())
+    else:
+        try:
+            os.utime(path)
+        except FileNotFoundError:  # trimmed by another process just now
+            return _local_copy(content_hash)
+    return path
+
+def delete_columnar(content_hash):
+    """Drop the stored copy of an upload, in GridFS and the local cache."""
+    for blob in fs_columnar.find({'filename': f"{content_hash}.arrow"}):
+        fs_columnar.delete(blob._id)
+    try:
+        os.remove(_local_path(content_hash))
+    except FileNotFoundError:
+        pass
+
+def _schema_names(path):
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema.names
+
+def load_columnar(content_hash, columns=None):
+    """Load the stored copy of an upload, optionally only some columns; None if there is none."""
+    if pa is None or not content_hash:
+        return None
+    path = _local_copy(content_hash)
+    if not path:
+        return None
+    if columns is not None:
+        available = set(_schema_names(path))
+        columns = [col for col in columns if col in available]
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+def stored_columns(content_hash):
+    """Column names of the stored copy, read from the Arrow schema alone; None if there is none."""
+    if pa is None or not content_hash:
+        return None
+    path = _local_copy(content_hash)
+    return _schema_names(path) if path else None
@@ -0,0 +1,204 @@
+"""
+Dataset profile computed once per upload.
+
+Holds what every entry point used to re-derive column by column: numeric
+coercion, Likert flags, value ranges, null counts, the grouping columns and
+(once detected) the category groups per feedback mode. Profiles are stored
+in the `profiles` collection under the SHA-256 of the uploaded bytes, so a
+later request for the same file skips profiling entirely.
+"""
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+import pandas as pd
+from pymongo import MongoClient
+from telemetry import span
+
+try:
+    import pyarrow  # noqa: F401
+    _ARROW_STRINGS = True
+except ImportError:
+    _ARROW_STRINGS = False
+
+# MongoDB setup
+client = MongoClient('mongodb://localhost:27017/')
+db = client['feedback_db']
+profiles_collection = db['profiles']
+
+PROFILE_VERSION = 1
+GROUP_COLUMN_NAMES = ['Branch', 'Department', 'Subject', 'Faculty', 'Class']  # customize as per your sheet
+
+_indexes_ready = False
+
+@dataclass
+class ColumnProfile:
+    name: str
+    dtype: str
+    numeric_dtype: bool
+    # Stakeholder rule: has numeric answers and all of them lie in 1-5
+    likert: bool
+    # Subject rule: every answer is a non-negative whole number
+    whole_numbers: bool
+    min: float = None
+    max: float = None
+    nulls: int = 0
+
+@dataclass
+class DatasetProfile:
+    rows: int
+    columns: dict
+    group_column: str = None
+    branch_column: str = None
+    # Memo of detected category groups, keyed by feedback mode (see feedback_processor.get_category_groups)
+    category_groups: dict = field(default_factory=dict)
+
+    def column(self, name):
+        return self.columns.get(str(name))
+
+    def is_likert(self, name):
+        col = self.column(name)
+        return bool(col and col.likert)
+
+    def is_whole_numbers(self, name):
+        col = self.column(name)
+        return bool(col and col.whole_numbers)
+
+    def numeric_dtype_columns(self):
+        return {name for name, col in self.columns.items() if col.numeric_dtype}
+
+    def to_document(self):
+        # Column and category names can contain '.', so they are stored as values, not keys
+        return {
+            'version': PROFILE_VERSION,
+            'rows': self.rows,
+            'columns': [asdict(col) for col in self.columns.values()],
+            'group_column': self.group_column,
+            'branch_column': self.branch_column,
+            'category_groups': [
+                {'mode': mode, 'groups': [[category, cols] for category, cols in groups.items()]}
+                for mode, groups in self.category_groups.items()
+            ]
+        }
+
+    @classmethod
+    def from_document(cls, doc):
+        return cls(
+            rows=doc['rows'],
+            columns={col['name']: ColumnProfile(**col) for col in doc['columns']},
+            group_column=doc.get('group_column'),
+            branch_column=doc.get('branch_column'),
+            category_groups={
+                entry['mode']: {category: cols for category, cols in entry['groups']}
+                for entry in doc.get('category_groups', [])
+            }
+        )
+
+def coerce_numeric(series):
+    if series.dtype == object:
+        series = series.astype(str).str.strip()
+    return pd.to_numeric(series, errors='coerce')
+
+def build_profile(df):
+    """Profile every column of df with one numeric coercion pass."""
+    numeric = df.apply(coerce_numeric)
+    nulls = df.isna().sum()
+    answered = len(df) - nulls
+    numeric_answers = numeric.notna().sum()
+    mins, maxs = numeric.min(), numeric.max()
+    whole = ((numeric % 1 == 0) | numeric.isna()).all()
+
+    columns = {}
+    for i, name in enumerate(df.columns):
+        col_min = None if pd.isna(mins.iloc[i]) else float(mins.iloc[i])
+        col_max = None if pd.isna(maxs.iloc[i]) else float(maxs.iloc[i])
+        columns[str(name)] = ColumnProfile(
+            name=str(name),
+            dtype=str(df.dtypes.iloc[i]),
+            numeric_dtype=bool(pd.api.types.is_numeric_dtype(df.dtypes.iloc[i])),
+            likert=bool(numeric_answers.iloc[i] > 0 and col_min >= 1 and col_max <= 5),
+            whole_numbers=bool(numeric_answers.iloc[i] == answered.iloc[i] and whole.iloc[i]
+                               and (col_min is None or col_min >= 0)),
+            min=col_min,
+            max=col_max,
+            nulls=int(nulls.iloc[i])
+        )
+
+    return DatasetProfile(
+        rows=len(df),
+        columns=columns,
+        group_column=find_group_column(df.columns),
+        branch_column=find_branch_column(df.columns)
+    )
+
+def find_group_column(columns):
+    group_names = [x.lower() for x in GROUP_COLUMN_NAMES]
+    return next((str(col) for col in columns if str(col).strip().lower() in group_names), None)
+
+def find_branch_column(columns):
+    return next((str(col) for col in columns if "branch" in str(col).lower()), None)
+
+def _merge_column(a, b):
+    col_min = min((x for x in (a.min, b.min) if x is not None), default=None)
+    col_max = max((x for x in (a.max, b.max) if x is not None), default=None)
+    return ColumnProfile(
+        name=a.name,
+        dtype=a.dtype if a.dtype == b.dtype else 'object',
+        numeric_dtype=a.numeric_dtype and b.numeric_dtype,
+        likert=bool(col_min is not None and col_min >= 1 and col_max <= 5),
+        whole_numbers=a.whole_numbers and b.whole_numbers,
+        min=col_min,
+        max=col_max,
+        nulls=a.nulls + b.nulls
+    )
+
+def merge_profiles(a, b):
+    """Profile of two row blocks with the same columns, as if build_profile had seen them together."""
+    return DatasetProfile(
+        rows=a.rows + b.rows,
+        columns={name: _merge_column(col, b.columns[name]) for name, col in a.columns.items()},
+        group_column=a.group_column,
+        branch_column=a.branch_column
+    )
+
+def normalize_frame(df, profile):
+    """Downcast a loaded upload to compact dtypes, printing its memory before and after.
+
+    Whole-number 1-5 Likert columns become nullable Int8, the grouping columns
+    pandas categories and suggestion text Arrow-backed strings (when pyarrow
+    is installed). Columns that do not fit are left as they are.
+    """
+    with span('normalize', rows=len(df)) as timing:
+        before = df.memory_usage(deep=True).sum()
+        df = df.copy(deep=False)
+        for name in df.columns:
+            col = profile.column(name)
+            if col is None or pd.api.types.is_extension_array_dtype(df[name].dtype):
+                continue
+            if col.likert and col.whole_numbers:
+                df[name] = coerce_numeric(df[name]).astype('Int8')
+            elif str(name) in (profile.group_column, profile.branch_column):
+                df[name] = df[name].astype('category')
+            elif 'suggestion' in str(name).lower() and df[name].dtype == object and _ARROW_STRINGS:
+                df[name] = df[name].astype('string[pyarrow]')
+        after = df.memory_usage(deep=True).sum()
+        timing.set(bytes_before=int(before), bytes=int(after))
+    return df
+
+def load_profile(sha256):
+    doc = profiles_collection.find_one({'sha256': sha256})
+    if not doc or doc.get('version') != PROFILE_VERSION:
+        return None
+    return DatasetProfile.from_document(doc)
+
+def save_profile(sha256, profile):
+    global _indexes_ready
+    if not _indexes_ready:
+        profiles_collection.create_index('sha256', unique=True)
+        _indexes_ready = True
+    profiles_collection.update_one(
+        {'sha256': sha256},
+        {'$set': {**profile.to_document(), 'updated_at': datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+def delete_profile(sha256):
+    profiles_collection.delete_one({'sha256': sha256})
@@ -1,17 +1,27 @@
 import pandas as pd
+import numpy as np
 import google.generativeai as genai
 import matplotlib.pyplot as plt
 from fpdf import FPDF
-import os, zipfile, json, re, textwrap
-from io import BytesIO
+import os, zipfile, json, re, textwrap, multiprocessing, zlib, hashlib, threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from io import BytesIO, RawIOBase
 from pymongo import MongoClient
-import gridfs
+from telemetry import span
+import llm_cache, histogram_store
+from gemini_client import GeminiClient
+from summarizers import summarize_local, DEFAULT_SUMMARIZER, STOPWORDS
+from dataset_profile import (build_profile, coerce_numeric, find_branch_column, find_group_column, load_profile,
+                             merge_profiles, normalize_frame, save_profile)
+from columnar_store import COLUMNAR_AVAILABLE, load_columnar, store_columnar
+from spreadsheet_reader import iter_csv_chunks, read_headers, read_spreadsheet, sniff_upload
+from chart_store import ChartScope, store_chart
 
 # MongoDB setup
 client = MongoClient('mongodb://localhost:27017/')  # Update with your MongoDB connection string
 db = client['feedback_db']
-charts_collection = db['charts']
-fs_charts = gridfs.GridFS(db, collection='charts')
 
 try:
     # Attempt to configure from environment variable first
@@ -25,6 +35,22 @@ except Exception as e:
     print(f"Could not configure Gemini. AI features will fail. Error: {e}")
     model = None
 
+SUMMARY_UNAVAILABLE = "Summary unavailable."
+SUMMARY_NOT_CONFIGURED = "Summary could not be generated (AI model not configured)."
+# Stand-ins for a summary Gemini did not produce; a report holding one is not cached
+FALLBACK_SUMMARIES = {SUMMARY_UNAVAILABLE, SUMMARY_NOT_CONFIGURED}
+
+_gemini_client = None
+
+def get_gemini_client():
+    """GeminiClient around the current module-level model (None if not configured)."""
+    global _gemini_client
+    if not model:
+        return None
+    if _gemini_client is None or _gemini_client.model is not model:
+        _gemini_client = GeminiClient(model)
+    return _gemini_client
+
 # gemini
 def detect_likert_categories_with_gemini(df):
     if not model: return {}
@@ -38,13 +64,14 @@ Return a valid Python dictionary in JSON format like:
 Sample data:
 {sample}
 """
+    response_text = ""
     try:
-        response = model.generate_content(prompt)
-        result_text = re.sub(r"^```(?:json|python)?|```$", "", response.text.strip()).strip()
+        response_text = get_gemini_client().generate(prompt)
+        result_text = re.sub(r"^```(?:json|python)?|```$", "", response_text).strip()
         return json.loads(result_text)
     except Exception as e:
         print(f"Gemini failed: {e}")
-        print(f"Raw output:\n{response.text}")
+        print(f"Raw output:\n{response_text}")
         return {}
 
 def extract_bracket_content(text):
@@ -67,26 +94,71 @@ def group_columns_by_category(df):
             category_groups[str(col)] = [col]
     return category_groups
 
-def summarize_suggestions_with_gemini(df, column_name):
-    if not model: return "Summary could not be generated (AI model not configured)."
-    suggestions = df[column_name].dropna().astype(str)
-    if suggestions.empty:
-        return "No suggestions provided."
-    combined_text = "\n".join(suggestions.tolist()[:50])
-    prompt = f"""
+def _suggestion_prompt(combined_text):
+    return f"""
 You are a helpful assistant.
 Given the following feedback suggestions from a student feedback form, write a grammatically correct, concise, and insightful summary.
 Feedback suggestions:
 {combined_text}
 """
-    try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        print(f"Gemini summarization failed: {e}")
-        return "Summary could not be generated."
+
+def summarize_suggestions_for_groups(group_dfs, column_name, summarizer='gemini'):
+    """Summarize the suggestions of several groups, e.g. every group of one report.
+
+    group_dfs is a list of (value, sub_df); returns {value: summary}. With the
+    'local' summarizer every group is summarized in-process from all of its
+    suggestions. With 'gemini', cached summaries are reused and the misses are
+    sent to Gemini concurrently, with SUMMARY_UNAVAILABLE for failed calls.
+    """
+    if summarizer == 'local':
+        with span('summaries', groups=len(group_dfs)):
+            return {value: summarize_local(sub_df[column_name].dropna().astype(str).tolist())
+                    for value, sub_df in group_dfs}
+
+    summaries, pending = {}, []
+    for value, sub_df in group_dfs:
+        suggestions = sub_df[column_name].dropna().astype(str)
+        if suggestions.empty:
+            summaries[value] = "No suggestions provided."
+            continue
+        combined_text = "\n".join(suggestions.tolist()[:50])
+        cache_key = llm_cache.text_fingerprint(combined_text)
+        cached = llm_cache.get('suggestion_summary', cache_key)
+        if cached:
+            summaries[value] = cached
+        else:
+            pending.append((value, cache_key, combined_text))
+
+    client = get_gemini_client()
+    if not client:
+        summaries.update((value, SUMMARY_NOT_CONFIGURED) for value, _, _ in pending)
+        return summaries
+
+    with span('summaries', groups=len(group_dfs), uncached=len(pending)):
+        results = client.generate_many([_suggestion_prompt(text) for _, _, text in pending])
+    for (value, cache_key, _), summary in zip(pending, results):
+        if summary:
+            llm_cache.put('suggestion_summary', cache_key, summary)
+            summaries[value] = summary
+        else:
+            summaries[value] = SUMMARY_UNAVAILABLE
+    return summaries
+
+def summarize_suggestions_with_gemini(df, column_name):
+    return summarize_suggestions_for_groups([(None, df)], column_name)[None]
+
+def _category_map_for_columns(pairs, columns):
+    # Cached maps are stored as [question, category] pairs under normalized headers;
+    # translate them back to this upload's exact column names
+    columns_by_header = {llm_cache.normalize_header(col): col for col in columns}
+    return {columns_by_header.get(llm_cache.normalize_header(question), question): category
+            for question, category in pairs}
 
 def detect_likert_categories_with_gemini_subject(df):
+    fingerprint = llm_cache.header_fingerprint(df.columns)
+    cached = llm_cache.get('subject_categories', fingerprint)
+    if cached:
+        return _category_map_for_columns(cached, df.columns)
     if not model: return {}
     sample = df.sample(min(5, len(df))).to_string(index=False)
     prompt = f"""
@@ -113,16 +185,196 @@ Return a **valid Python dictionary** in JSON format as:
 Here is the sample data:
 {sample}
 """
+    response_text = ""
     try:
-        response = model.generate_content(prompt)
-        result_text = re.sub(r"^```(?:json|python)?|```$", "", response.text.strip()).strip()
-        return json.loads(result_text)
+        response_text = get_gemini_client().generate(prompt)
+        result_text = re.sub(r"^```(?:json|python)?|```$", "", response_text).strip()
+        category_map = json.loads(result_text)
+        if category_map:
+            llm_cache.put('subject_categories', fingerprint,
+                          [[llm_cache.normalize_header(q), c] for q, c in category_map.items()])
+        return category_map
     except Exception as e:
         print("Gemini failed. Raw output:")
-        print(response.text)
+        print(response_text)
         print(f"Error: {e}")
         return {}
 
+CATEGORY_DETECTORS = ['gemini', 'local']
+DEFAULT_CATEGORY_DETECTOR = os.environ.get('CATEGORY_DETECTOR', 'gemini')
+
+# Whole headers of small-integer columns that are not rating questions ("Roll No", "Sr. No.", "Year", ...);
+# anchored so question wording such as "(1 = no, 5 = yes)" is not mistaken for one
+NON_QUESTION_HEADER = re.compile(
+    r'^\s*((roll|sr|serial|s|student|reg|registration|enrollment|enrolment|phone|mobile|contact)[\s._-]*(no|number|num|id)?'
+    r'|id|no|number|year|sem|semester|div|division|batch|section|age)\.?\s*$', re.I
+)
+HEADER_STOPWORDS = STOPWORDS | {'rate', 'rating', 'scale', 'how', 'well', 'level', 'overall', 'extent', 'q'}
+HEADER_SIMILARITY = 0.3
+
+def _header_tokens(header):
+    # Ordered and de-duplicated, so category names read in header word order
+    return list(dict.fromkeys(t for t in re.findall(r"[a-z0-9]+", str(header).lower())
+                              if t not in HEADER_STOPWORDS and len(t) > 1))
+
+def _header_similarity(a, b):
+    # Overlap coefficient: short headers sharing their topic word still match
+    return len(a & b) / min(len(a), len(b)) if a and b else 0.0
+
+def is_likert_column(series):
+    """True when every answer is a whole number on the 1-5 scale."""
+    values = series.dropna()
+    if values.empty:
+        return False
+    numeric = pd.to_numeric(values, errors='coerce')
+    if numeric.isna().any():
+        return False
+    return bool(numeric.between(1, 5).all() and (numeric % 1 == 0).all())
+
+def detect_likert_categories_local(df):
+    """Offline stand-in for detect_likert_categories_with_gemini_subject.
+
+    Profiles each column's value domain to find 1-5 rating questions, then
+    groups them: by the 'Category [Question]' prefix when headers use it,
+    otherwise by greedy token-overlap clustering of the header text. Returns
+    the same {question: category} mapping, deterministically.
+    """
+    questions = [col for col in df.columns
+                 if not NON_QUESTION_HEADER.search(str(col)) and is_likert_column(df[col])]
+    if not questions:
+        return {}
+    if all('[' in str(col) and ']' in str(col) for col in questions):
+        return {col: extract_category_name(col) for col in questions}
+
+    ordered_tokens = {col: _header_tokens(col) for col in questions}
+    # Words in most headers ("subject", "teacher", ...) do not tell questions apart
+    frequency = pd.Series([t for col in questions for t in ordered_tokens[col]], dtype=object).value_counts()
+    common = set(frequency[frequency > max(2, 0.6 * len(questions))].index)
+    ordered_tokens = {col: [t for t in toks if t not in common] for col, toks in ordered_tokens.items()}
+    tokens = {col: set(toks) for col, toks in ordered_tokens.items()}
+
+    clusters = []
+    for col in questions:
+        best, best_score = None, 0.0
+        for cluster in clusters:
+            score = max(_header_similarity(tokens[col], tokens[m]) for m in cluster)
+            if score > best_score:
+                best, best_score = cluster, score
+        if best is not None and best_score >= HEADER_SIMILARITY:
+            best.append(col)
+        else:
+            clusters.append([col])
+
+    category_map = {}
+    for cluster in clusters:
+        if len(cluster) == 1 and len(questions) > 3:
+            category = "Other Questions"
+        else:
+            cluster_tokens = [t for col in cluster for t in ordered_tokens[col]]
+            counts = pd.Series(cluster_tokens, dtype=object).value_counts(sort=False)
+            top = sorted(counts.index, key=lambda t: (-counts[t], cluster_tokens.index(t)))[:2]
+            category = " ".join(t.title() for t in top) or "General"
+        for col in cluster:
+            category_map[col] = category
+    return category_map
+
+def detect_subject_categories(df, category_detector=DEFAULT_CATEGORY_DETECTOR):
+    """({question: category}, detector that produced it) for subject feedback.
+
+    'gemini' asks the model and falls back to the local detector when it
+    returns nothing (model missing, quota exhausted or unparsable output);
+    the map is then reported as 'local'.
+    """
+    if category_detector == 'gemini':
+        gemini_map = detect_likert_categories_with_gemini_subject(df)
+        if gemini_map:
+            return gemini_map, 'gemini'
+        print("Gemini category detection returned nothing; using local detector")
+    return detect_likert_categories_local(df), 'local'
+
+def get_category_groups(df, profile, feedback_type='stakeholder', category_detector=DEFAULT_CATEGORY_DETECTOR):
+    """(Likert category groups for df, detector that produced them), memoized on its DatasetProfile per feedback mode.
+
+    The detector is category_detector unless subject detection fell back to
+    'local'; stakeholder groups come from the headers whatever was asked for.
+    """
+    mode = 'stakeholder' if feedback_type == 'stakeholder' else f"subject:{category_detector}"
+    if mode not in profile.category_groups:
+        category_groups = {}
+        if feedback_type == 'stakeholder':
+            for category, cols in group_columns_by_category(df).items():
+                likert_cols = [col for col in cols if profile.is_likert(col)]
+                if likert_cols:
+                    category_groups[category] = likert_cols
+        else:  # subject feedback
+            category_map, detector = detect_subject_categories(df, category_detector)
+            for question, category in category_map.items():
+                if question in df.columns and profile.is_whole_numbers(question):
+                    category_groups.setdefault(category.strip(), []).append(question)
+            # A local fallback for a Gemini miss is memoized as 'subject:local', so the next
+            # 'gemini' request asks Gemini again instead of reusing it
+            profile.category_groups[f"subject:{detector}"] = category_groups
+            return category_groups, detector
+        profile.category_groups[mode] = category_groups
+    return profile.category_groups[mode], category_detector
+
+def _projected_columns(profile, feedback_type, category_detector):
+    # Once the profile knows this mode's category groups, a run only needs those
+    # questions plus the grouping and suggestion columns; None means all columns
+    mode = 'stakeholder' if feedback_type == 'stakeholder' else f"subject:{category_detector}"
+    category_groups = profile.category_groups.get(mode) if profile else None
+    if category_groups is None:
+        return None
+    needed = {col for cols in category_groups.values() for col in cols}
+    needed |= {profile.group_column, profile.branch_column}
+    return [name for name in profile.columns if name in needed or 'suggestion' in name.lower()]
+
+def compact_dtypes(profile):
+    # Columns that parsed as numbers and hold Likert answers fit in float32
+    if profile is None:
+        return None
+    return {name: 'float32' for name, col in profile.columns.items() if col.numeric_dtype and col.likert}
+
+def _load_frame(source, filename, feedback_type, category_detector, profile=None, content_hash=None):
+    # Prefer the upload's stored columnar copy (projected to the needed columns);
+    # the original file is parsed only when there is none, and the parsed frame
+    # is then stored so the next request skips parsing
+    if profile is None and content_hash:
+        profile = load_profile(content_hash)
+    columns = _projected_columns(profile, feedback_type, category_detector)
+    df = None
+    if content_hash:
+        with span('load_columnar') as timing:
+            df = load_columnar(content_hash, columns)
+            timing.set(rows=0 if df is None else len(df))
+    if df is None:
+        store = bool(content_hash) and COLUMNAR_AVAILABLE
+        # The stored copy must hold every column, so only project when nothing is stored
+        with span('parse') as timing:
+            df = read_spreadsheet(source, filename, usecols=None if store else columns, dtype=compact_dtypes(profile))
+            timing.set(rows=len(df), columns=len(df.columns))
+        if store:
+            with span('store_columnar', rows=len(df)):
+                store_columnar(content_hash, df)
+    return df, profile
+
+def _profile_and_groups(df, feedback_type, category_detector, profile=None, content_hash=None):
+    # (profile, category_groups, detector that ran: see get_category_groups). With the upload's
+    # content_hash the profile is loaded from, and anything newly computed saved back to, the profiles collection
+    if profile is None and content_hash:
+        profile = load_profile(content_hash)
+    fresh = profile is None
+    if fresh:
+        with span('profile', rows=len(df), columns=len(df.columns)):
+            profile = build_profile(df)
+    known_modes = set(profile.category_groups)
+    with span('likert_detection') as timing:
+        category_groups, detector = get_category_groups(df, profile, feedback_type, category_detector)
+        timing.set(categories=len(category_groups), questions=sum(len(cols) for cols in category_groups.values()))
+    if content_hash and (fresh or set(profile.category_groups) != known_modes):
+        save_profile(content_hash, profile)
+    return profile, category_groups, detector
+
 def sanitize_text(text):
     if pd.isna(text):
         return ""
@@ -137,50 +389,129 @@ def sanitize_text(text):
     return clean_text.encode('latin-1', 'replace').decode('latin-1')
 
 #table and chart
-def generate_summary_table(sub_df, category_cols, feedback_type='stakeholder'):
-    summary = {}
-    for col in category_cols:
-        if col in sub_df.columns:
-            if feedback_type == 'stakeholder':
-                # Coerce to numeric, drop non-numeric, convert to int, then get value counts
-                scores = pd.to_numeric(sub_df[col], errors='coerce').dropna()
-                # Ensure scores are within a reasonable Likert range (e.g., 1-5)
-                scores = scores[scores.between(1, 5)].astype(int).value_counts().to_dict()
-                bracket_content = extract_bracket_content(col)
-                summary[bracket_content] = {i: scores.get(i, 0) for i in range(1, 6)} # Range 1-5
-            else:  # subject feedback
-                cleaned = pd.to_numeric(sub_df[col], errors='coerce').dropna().astype(int)
-                if cleaned.empty:
-                    continue
-                score_counts = cleaned.value_counts().to_dict()
-                summary[col] = {i: score_counts.get(i, 0) for i in range(1, 6)}
-
-    if not summary:
-        return pd.DataFrame()
+LIKERT_SCORES = [5, 4, 3, 2, 1]
+OVERALL_GROUP = 'All Students'
+HISTOGRAM_INDEX = ['Group', 'Category', 'Question']
+HISTOGRAM_COLUMNS = ['Total'] + [c for i in LIKERT_SCORES for c in (i, f"% of {i}")] + ['Answered']
+
+def likert_codes(df, cols, profile=None):
+    """Coerce a block of Likert columns once into an int8 matrix.
+
+    1-5 are scores (fractional answers are truncated), 0 marks a missing or
+    non-numeric cell and 6 a numeric answer outside the 1-5 scale. Columns
+    the profile already knows to be numeric are not coerced again.
+    """
+    numeric_cols = profile.numeric_dtype_columns() if profile else set()
+    block = df[cols]
+    to_coerce = [col for col in cols if str(col) not in numeric_cols]
+    if to_coerce:
+        block = block.copy()
+        block[to_coerce] = block[to_coerce].apply(coerce_numeric)
+    numeric = block.to_numpy(dtype='float64', na_value=np.nan)
+    codes = np.zeros(numeric.shape, dtype=np.int8)
+    codes[~np.isnan(numeric)] = 6
+    in_scale = (numeric >= 1) & (numeric <= 5)
+    codes[in_scale] = numeric[in_scale].astype(np.int8)
+    return codes
+
+def compute_likert_histograms(df, category_groups, group_col=None, profile=None):
+    """Count 1-5 answers for every (group, category, question) in one pass.
+
+    Rows are bucketed with a single bincount over all groups at once. The
+    result is indexed by HISTOGRAM_INDEX; without group_col every row falls
+    into OVERALL_GROUP, and like df.groupby rows with a missing group are
+    dropped.
+    """
+    pairs = [(category, col) for category, cols in category_groups.items()
+             for col in cols if col in df.columns]
+    if not pairs:
+        return _histogram_frame(None, [], [], pairs)
+
+    cols = list(dict.fromkeys(col for _, col in pairs))
+    counts, groups = count_likert(df, cols, group_col, profile)
+    return _histogram_frame(counts, groups, cols, pairs)
+
+def count_likert(df, cols, group_col=None, profile=None):
+    """(counts, groups): the (group, column in cols, likert code) tallies of df, groups sorted."""
+    with span('histograms', rows=len(df), questions=len(cols)) as timing:
+        codes = likert_codes(df, cols, profile)
+        if group_col is None:
+            group_codes, groups = np.zeros(len(df), dtype=np.intp), [OVERALL_GROUP]
+        else:
+            group_codes, groups = pd.factorize(df[group_col], sort=True)
+        in_group = group_codes >= 0
+
+        n_groups, n_cols = len(groups), len(cols)
+        bins = (group_codes[in_group, None] * n_cols + np.arange(n_cols)) * 7 + codes[in_group]
+        counts = np.bincount(bins.ravel(), minlength=n_groups * n_cols * 7).reshape(n_groups, n_cols, 7)
+        timing.set(groups=n_groups)
+    return counts, list(groups)
+
+def _histogram_frame(counts, groups, cols, pairs):
+    # counts holds (group, column in cols, likert code) tallies; rows are built for the (category, column) pairs
+    if not pairs:
+        index = pd.MultiIndex.from_tuples([], names=HISTOGRAM_INDEX)
+        return pd.DataFrame(columns=HISTOGRAM_COLUMNS, index=index)
+
+    col_pos = {col: i for i, col in enumerate(cols)}
+    counts = counts[:, [col_pos[col] for _, col in pairs], :].reshape(-1, 7)
+    scores = counts[:, 5:0:-1]  # bins 5..1, in LIKERT_SCORES order
+    total = scores.sum(axis=1)
+    percents = np.divide(scores * 100, total[:, None], out=np.zeros(scores.shape), where=total[:, None] > 0).round(2)
+
+    index = pd.MultiIndex.from_tuples(
+        [(group, category, col) for group in groups for category, col in pairs], names=HISTOGRAM_INDEX
+    )
+    hist = pd.DataFrame({'Total': total}, index=index)
+    for pos, i in enumerate(LIKERT_SCORES):
+        hist[i] = scores[:, pos]
+        hist[f"% of {i}"] = percents[:, pos]
+    hist['Answered'] = total + counts[:, 6]
+    return hist
+
+def group_positions(series):
+    """{value: row positions} for each non-missing value of series, sorted like df.groupby."""
+    codes, values = pd.factorize(series, sort=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+    return {value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(values)}
+
+def histogram_for_group(histogram, group):
+    """Slice one group out of a compute_likert_histograms result."""
+    if group not in histogram.index.get_level_values('Group'):
+        return histogram.iloc[:0].droplevel('Group')
+    return histogram.xs(group, level='Group')
+
+def generate_summary_table(sub_df, category_cols, feedback_type='stakeholder', histogram=None):
+    """Build the per-category table shown in reports and charts.
+
+    This is a view over compute_likert_histograms; pass the group's slice
+    (see histogram_for_group) as histogram to reuse counts already computed
+    for the whole upload instead of re-counting sub_df.
+    """
+    if histogram is None:
+        histogram = histogram_for_group(
+            compute_likert_histograms(sub_df, {'': category_cols}), OVERALL_GROUP
+        )
+
+    rows = histogram.droplevel('Category')
+    rows = rows[~rows.index.duplicated()]
+    rows = rows.loc[[col for col in category_cols if col in rows.index]]
 
-    score_df = pd.DataFrame(summary).T.fillna(0).astype(int)
-    score_df["Total"] = score_df[[5, 4, 3, 2, 1]].sum(axis=1)
-    
-    # Calculate percentages for scores 1 through 5
-    for i in range(5, 0, -1):
-        if i in score_df.columns:
-            score_df[f"% of {i}"] = score_df.apply(
-                lambda row: round(row[i] * 100 / row["Total"], 2) if row["Total"] > 0 else 0, axis=1
-            )
-    
-    # Define columns to return
     if feedback_type == 'stakeholder':
-        cols_to_return = ["Category", "Total"]
-        for i in range(5, 0, -1):
-            if i in score_df.columns:
-                cols_to_return.extend([i, f"% of {i}"])
-        return score_df.reset_index().rename(columns={"index": "Category"})[cols_to_return]
+        labels = [extract_bracket_content(col) for col in rows.index]
     else:  # subject feedback
-        score_df = score_df.reset_index().rename(columns={"index": "Category"})
-        return score_df[["Category", "Total", 5, "% of 5", 4, "% of 4", 3, "% of 3", 2, "% of 2", 1, "% of 1"]]
+        rows = rows[rows['Answered'] > 0]
+        labels = list(rows.index)
 
-def plot_ratings(score_df, name, title_prefix, feedback_type='stakeholder'):
-    if score_df.empty: return None
+    if rows.empty:
+        return pd.DataFrame()
+
+    score_df = rows[HISTOGRAM_COLUMNS[:-1]].reset_index(drop=True)
+    score_df.insert(0, "Category", labels)
+    return score_df
+
+def _draw_ratings(score_df, name, title_prefix, feedback_type):
     # Plot ratings for scores 1-5
     plot_cols = [col for col in [5, 4, 3, 2, 1] if col in score_df.columns]
     df_plot = score_df.set_index("Category")[plot_cols]
@@ -207,36 +538,76 @@ def plot_ratings(score_df, name, title_prefix, feedback_type='stakeholder'):
         ax.set_xticklabels(wrapped_labels, rotation=0, ha='center')
         plt.tight_layout()
 
+    return chart_filename(name, title_prefix)
+
+def chart_filename(name, title_prefix):
     # Sanitize filename
     safe_name = re.sub(r'[^a-zA-Z0-9_-]', '_', name)
     safe_prefix = re.sub(r'[^a-zA-Z0-9_-]', '_', title_prefix)
-    safe_filename = f"{safe_prefix}_{safe_name}.png"
-    
-    # Save to BytesIO instead of file
+    return f"{safe_prefix}_{safe_name}.png"
+
+def _figure_png():
     buffer = BytesIO()
     plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    
-    # Store in MongoDB GridFS
-    chart_id = fs_charts.put(
-        buffer.getvalue(),
-        filename=safe_filename,
-        content_type='image/png'
-    )
-    
-    # Store metadata
-    charts_collection.insert_one({
-        'chart_id': chart_id,
-        'filename': safe_filename,
-        'content_type': 'image/png',
-        'size': len(buffer.getvalue())
-    })
-    
+    return buffer.getvalue()
+
+def plot_ratings(score_df, name, title_prefix, feedback_type='stakeholder', scope=None):
+    if score_df.empty: return None
+    with span('chart', charts=1) as timing:
+        safe_filename = _draw_ratings(score_df, name, title_prefix, feedback_type)
+        png_bytes = _figure_png()
+        timing.set(bytes=len(png_bytes))
+    if scope:
+        safe_filename = scope.filename(safe_filename)
+    store_chart(safe_filename, png_bytes, scope)
     plt.close()
-    buffer.close()
-    
     return safe_filename # Return only the filename
 
+# Report charts go straight into the PDF; REPORT_CHART_STORE says whether they are
+# also kept in GridFS: 'off' (nothing refers to them), 'async' (on a background
+# thread) or 'sync'. Kept copies are always scoped, see chart_store.ChartScope
+REPORT_CHART_STORE = os.environ.get('REPORT_CHART_STORE', 'off')
+_chart_store_pool = None
+
+def _store_chart_later(filename, png_bytes, scope):
+    global _chart_store_pool
+    if _chart_store_pool is None:
+        _chart_store_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chart-store')
+    def report_failure(future):
+        if future.exception():
+            print(f"Could not store chart {filename}: {future.exception()}")
+
+    _chart_store_pool.submit(store_chart, filename, png_bytes, scope).add_done_callback(report_failure)
+
+def render_chart(score_df, name, title_prefix, feedback_type='stakeholder', store=None, scope=None):
+    """Draw a ratings chart for a PDF: returns (filename, raster) or None.
+
+    raster is the figure's pixels as an fpdf image record (see
+    insert_chart), so the PDF needs no PNG decode, GridFS read or temp file.
+    A stored copy is named under scope (a fresh one if none is given).
+    """
+    if score_df.empty: return None
+    store = store or REPORT_CHART_STORE
+    with span('chart', charts=1) as timing:
+        safe_filename = _draw_ratings(score_df, name, title_prefix, feedback_type)
+        figure = plt.gcf()
+        figure.canvas.draw()
+        rgba = np.asarray(figure.canvas.buffer_rgba())
+        raster = {
+            'w': rgba.shape[1], 'h': rgba.shape[0], 'cs': 'DeviceRGB', 'bpc': 8, 'f': 'FlateDecode',
+            'pal': '', 'trns': '', 'data': zlib.compress(np.ascontiguousarray(rgba[:, :, :3]).tobytes())
+        }
+        timing.set(bytes=len(raster['data']))
+    if store in ('sync', 'async'):
+        scope = scope or ChartScope.new()
+        safe_filename = scope.filename(safe_filename)
+        if store == 'sync':
+            store_chart(safe_filename, _figure_png(), scope)
+        else:
+            _store_chart_later(safe_filename, _figure_png(), scope)
+    plt.close(figure)
+    return safe_filename, raster
+
 # pdf
 class StakeholderPDF(FPDF):
     def header(self):
@@ -285,25 +656,13 @@ class StakeholderPDF(FPDF):
                 self.cell(other_col_width, height_of_row, str(item), border=1, align='C')
             self.ln(height_of_row)
 
-    def insert_image_from_mongodb(self, filename, y_margin=10):
-        try:
-            # Find chart in GridFS
-            chart_doc = fs_charts.find_one({"filename": filename})
-            if chart_doc:
-                self.add_page()
-                # Save chart to temporary file for PDF insertion
-                import tempfile
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                    tmp.write(chart_doc.read())
-                    tmp_path = tmp.name
-                
-                self.image(tmp_path, x=10, y=30, w=self.w - 20)
-                self.set_y(self.get_y() + self.h * 0.4)
-                
-                # Clean up temporary file
-                os.unlink(tmp_path)
-        except Exception as e:
-            print(f"Error inserting image from MongoDB: {e}")
+    def insert_chart(self, filename, raster):
+        # Register the pixels under the chart's name so fpdf does not try to open it as a file
+        if filename not in self.images:
+            self.images[filename] = dict(raster, i=len(self.images) + 1)
+        self.add_page()
+        self.image(filename, x=10, y=30, w=self.w - 20)
+        self.set_y(120)
 
     def add_summary(self, text):
         self.add_page()
@@ -370,276 +729,781 @@ class SubjectPDF(FPDF):
                 self.cell(other_col_width, height_needed, str(item), border=1, align='C')
             self.ln(height_needed)
 
-    def insert_image_from_mongodb(self, filename, y_margin=10):
-        try:
-            # Find chart in GridFS
-            chart_doc = fs_charts.find_one({"filename": filename})
-            if chart_doc:
-                self.add_page()
-                # Save chart to temporary file for PDF insertion
-                import tempfile
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                    tmp.write(chart_doc.read())
-                    tmp_path = tmp.name
-                
-                self.image(tmp_path, x=10, y=30, w=self.w - 20)
-                self.set_y(120)
-                
-                # Clean up temporary file
-                os.unlink(tmp_path)
-        except Exception as e:
-            print(f"Error inserting image from MongoDB: {e}")
+    def insert_chart(self, filename, raster):
+        # Register the pixels under the chart's name so fpdf does not try to open it as a file
+        if filename not in self.images:
+            self.images[filename] = dict(raster, i=len(self.images) + 1)
+        self.add_page()
+        self.image(filename, x=10, y=30, w=self.w - 20)
+        self.set_y(120)
 
 # report generation
-def generate_stakeholder_report(sub_df, name, value, category_groups):
+def pdf_bytes(pdf):
+    # fpdf 1.7 returns the document as a latin-1 str when asked for a string
+    return pdf.output(dest='S').encode('latin-1')
+
+def generate_stakeholder_report(sub_df, name, value, category_groups, histogram=None, suggestion_summary=None,
+                                summarizer=DEFAULT_SUMMARIZER, chart_scope=None):
     pdf = StakeholderPDF()
     pdf.add_page()
     pdf.set_font('Arial', 'B', 14)
     pdf.cell(0, 10, sanitize_text(f"{name} Feedback Report: {value}"), ln=1, align='C')
     pdf.ln(10)
     
+    if histogram is None:
+        histogram = histogram_for_group(compute_likert_histograms(sub_df, category_groups), OVERALL_GROUP)
     chart_files = []
 
     for category, cols in category_groups.items():
         valid_cols = [col for col in cols if col in sub_df.columns]
         if not valid_cols: continue
         
-        summary_df = generate_summary_table(sub_df, valid_cols, 'stakeholder')
+        summary_df = generate_summary_table(sub_df, valid_cols, 'stakeholder', histogram)
         if not summary_df.empty:
             pdf.section_title(f"{category} Feedback Summary")
             pdf.table(summary_df)
             pdf.ln(10)
             
-            chart_file = plot_ratings(summary_df, category, f"{name}_{value}", 'stakeholder')
-            if chart_file:
-                chart_files.append(chart_file)
+            chart = render_chart(summary_df, category, f"{name}_{value}", 'stakeholder',
+                                 'sync' if chart_scope else None, chart_scope)
+            if chart:
+                chart_files.append(chart)
 
-    for chart in chart_files:
-        pdf.insert_image_from_mongodb(chart)
+    for chart_file, raster in chart_files:
+        pdf.insert_chart(chart_file, raster)
 
     suggestion_col = next((col for col in sub_df.columns if 'suggestion' in col.lower()), None)
     if suggestion_col:
-        suggestion_summary = summarize_suggestions_with_gemini(sub_df, suggestion_col)
+        if suggestion_summary is None:
+            suggestion_summary = summarize_suggestions_for_groups([(value, sub_df)], suggestion_col, summarizer)[value]
         pdf.add_summary(suggestion_summary)
 
-    output_dir = "feedback_catalyst"
-    os.makedirs(output_dir, exist_ok=True)
     safe_value = re.sub(r'[^a-zA-Z0-9_-]', '_', str(value))
-    pdf_path = os.path.join(output_dir, f"{name}_{safe_value}_report.pdf")
-    pdf.output(pdf_path)
-    return pdf_path
+    return f"{name}_{safe_value}_report.pdf", pdf_bytes(pdf)
 
-def generate_subject_report(sub_df, name, value, category_groups):
+def generate_subject_report(sub_df, name, value, category_groups, histogram=None, chart_scope=None):
     pdf = SubjectPDF()
     pdf.add_page()
     pdf.set_font('Arial', 'B', 12)
     pdf.cell(0, 10, sanitize_text(f"{name} Feedback Report: {value}"), ln=1)
 
+    if histogram is None:
+        histogram = histogram_for_group(compute_likert_histograms(sub_df, category_groups), OVERALL_GROUP)
     summary_tables, chart_paths = [], []
 
     for category, cols in category_groups.items():
         valid_cols = [col for col in cols if col in sub_df.columns]
         if not valid_cols:
             continue
-        summary_df = generate_summary_table(sub_df, valid_cols, 'subject')
+        summary_df = generate_summary_table(sub_df, valid_cols, 'subject', histogram)
         if not summary_df.empty:
-            chart_path = plot_ratings(summary_df, category, f"{name}_{value}", 'subject')
+            chart = render_chart(summary_df, category, f"{name}_{value}", 'subject',
+                                 'sync' if chart_scope else None, chart_scope)
             summary_tables.append((category, summary_df))
-            if chart_path:
-                chart_paths.append((category, chart_path))
+            if chart:
+                chart_paths.append((category, chart))
 
     for category, df_summary in summary_tables:
         pdf.section_title(f"{category} Feedback Summary")
         pdf.table(df_summary, pdf.get_y() + 5)
         pdf.ln(10)
 
-    for _, chart in chart_paths:
-        pdf.insert_image_from_mongodb(chart)
+    for _, (chart_file, raster) in chart_paths:
+        pdf.insert_chart(chart_file, raster)
 
     safe_value = str(value).replace(" ", "_").replace("/", "-").replace(".", "_")
-    output_dir = "feedback_catalyst"
-    os.makedirs(output_dir, exist_ok=True)
-    pdf_path = os.path.join(output_dir, f"{name}_{safe_value}_report.pdf")
-    pdf.output(pdf_path)
-    return pdf_path
+    return f"{name}_{safe_value}_report.pdf", pdf_bytes(pdf)
 
-def _get_data_and_groups(file_path, feedback_type='stakeholder'):
+def _get_data_and_groups(file_path, feedback_type='stakeholder', category_detector=DEFAULT_CATEGORY_DETECTOR, profile=None, content_hash=None):
     """Helper to read data and identify column groups."""
-    try:
-        df = pd.read_excel(file_path)
-    except Exception:
-        df = pd.read_csv(file_path)
+    df, profile = _load_frame(file_path, file_path, feedback_type, category_detector, profile, content_hash)
 
-    os.makedirs("feedback_catalyst", exist_ok=True)
-    
-    if feedback_type == 'stakeholder':
-        category_groups_raw = group_columns_by_category(df)
-        category_groups = {}
-        for category, cols in category_groups_raw.items():
-            likert_cols = []
-            for col in cols:
-                if col in df.columns:
-                    numeric_vals = pd.to_numeric(df[col], errors='coerce').dropna()
-                    if not numeric_vals.empty and numeric_vals.between(1, 5, inclusive='both').all():
-                        likert_cols.append(col)
-            if likert_cols:
-                category_groups[category] = likert_cols
-    else:  # subject feedback
-        category_map = detect_likert_categories_with_gemini_subject(df)
-        category_groups = {}
-        for question, category in category_map.items():
-            if question in df.columns:
-                if df[question].dropna().apply(lambda x: str(x).strip().isdigit()).all():
-                    category_groups.setdefault(category.strip(), []).append(question)
+    profile, category_groups, _ = _profile_and_groups(df, feedback_type, category_detector, profile, content_hash)
     
-    return df, category_groups
+    return normalize_frame(df, profile), category_groups
 
 import pandas as pd
 import zipfile
 from io import BytesIO
 import os
 
-def process_feedback(file_bytes, filename, choice, feedback_type='stakeholder', save_to_disk=False, save_chart_fn=None):
-    try:
-        # Read Excel or CSV from BytesIO
+# CSV uploads larger than this are aggregated chunk by chunk instead of loaded whole
+STREAM_THRESHOLD_BYTES = int(os.environ.get('STREAM_THRESHOLD_BYTES', str(100 * 1024 * 1024)))
+STREAM_CHUNK_ROWS = int(os.environ.get('STREAM_CHUNK_ROWS', '50000'))
+SUGGESTION_SAMPLE_SIZE = int(os.environ.get('SUGGESTION_SAMPLE_SIZE', '500'))
+STREAM_HEAD_ROWS = 1000
+
+@dataclass
+class StreamedUpload:
+    """What aggregate_csv_stream keeps of an upload in place of its rows."""
+    profile: object
+    head: pd.DataFrame  # first rows, for category detection
+    columns: list
+    groups: list  # group values in order of first appearance
+    counts: np.ndarray  # (group, column, likert code) tallies
+    samples: dict  # group value -> sampled suggestion answers
+    suggestion_column: str = None
+
+    def frame(self):
+        # Report and chart builders only read column names off their frame once counts are given
+        return self.head.iloc[:0]
+
+    def histogram(self, category_groups, groups=None):
+        """Same result as compute_likert_histograms, for groups (default: all, in first-seen order)."""
+        groups = self.groups if groups is None else groups
+        pairs = [(category, col) for category, cols in category_groups.items()
+                 for col in cols if col in self.columns]
+        position = {value: i for i, value in enumerate(self.groups)}
+        return _histogram_frame(self.counts[[position[value] for value in groups]], groups, self.columns, pairs)
+
+    def summaries(self, groups, summarizer=DEFAULT_SUMMARIZER):
+        """Suggestion summaries from the sampled answers, as summarize_suggestions_for_groups returns them."""
+        if not self.suggestion_column:
+            return {}
+        col = self.suggestion_column
+        return summarize_suggestions_for_groups(
+            [(value, pd.DataFrame({col: self.samples.get(value, [])})) for value in groups], col, summarizer
+        )
+
+def should_stream(source, filename=None):
+    fmt, size = sniff_upload(source, filename)
+    return fmt == 'csv' and size > STREAM_THRESHOLD_BYTES
+
+def _reservoir_add(reservoir, seen, items, rng, size):
+    # Algorithm R over a batch: afterwards reservoir is a uniform sample of all seen + len(items) answers
+    fill = min(max(size - len(reservoir), 0), len(items))
+    reservoir.extend(items[:fill])
+    if fill == len(items):
+        return
+    # The answer numbered t (0-based, over everything seen) takes slot randint(0, t) if that is < size
+    slots = (rng.random(len(items) - fill) * np.arange(seen + fill + 1, seen + len(items) + 1)).astype(np.int64)
+    for i in np.flatnonzero(slots < size):
+        reservoir[slots[i]] = items[fill + i]
+
+def _reservoir_merge(reservoir, seen, batch, batch_seen, rng, size):
+    # Uniform sample of seen + batch_seen answers from uniform samples of each part:
+    # how many come from the batch follows the hypergeometric split of the combined draw
+    take = min(size, seen + batch_seen)
+    from_batch = int(rng.hypergeometric(batch_seen, seen, take)) if take else 0
+    keep = [reservoir[i] for i in rng.choice(len(reservoir), take - from_batch, replace=False)]
+    return keep + [batch[i] for i in rng.choice(len(batch), from_batch, replace=False)]
+
+def aggregate_csv_stream(source, group_col=None, chunksize=STREAM_CHUNK_ROWS, sample_size=SUGGESTION_SAMPLE_SIZE):
+    """Read a CSV in chunks into per-group Likert tallies, a profile and suggestion samples.
+
+    Every column is tallied (codes as in likert_codes) so category groups can
+    be chosen after the pass, and each group keeps a reservoir sample of up to
+    sample_size suggestion answers; memory grows with groups x columns, not
+    rows. Without group_col every row counts towards OVERALL_GROUP; like
+    df.groupby, rows with a missing group are dropped. The group and
+    suggestion columns are read as text, so a value reads the same in every
+    chunk whatever the other values around it.
+    """
+    rng = np.random.default_rng(0)
+    profile = head = None
+    suggestion_col = next((col for col in read_headers(source) if 'suggestion' in col.lower()), None)
+    text_columns = {col: str for col in (group_col, suggestion_col) if col}
+    columns, position, counts, samples, seen = [], {}, [], {}, {}
+    for chunk in iter_csv_chunks(source, chunksize, text_columns or None):
+        chunk_profile = build_profile(chunk)
+        if profile is None:
+            profile, head, columns = chunk_profile, chunk.head(STREAM_HEAD_ROWS), list(chunk.columns)
+        else:
+            profile = merge_profiles(profile, chunk_profile)
+
+        if group_col is None:
+            group_codes, values = np.zeros(len(chunk), dtype=np.intp), [OVERALL_GROUP]
+        else:
+            group_codes, values = pd.factorize(chunk[group_col])
+        for value in values:
+            if value not in position:
+                position[value] = len(counts)
+                counts.append(np.zeros((len(columns), 7), dtype=np.int64))
+                samples[value], seen[value] = [], 0
+
+        n_values, n_cols = len(values), len(columns)
+        codes = likert_codes(chunk, columns, chunk_profile)
+        in_group = group_codes >= 0
+        bins = (group_codes[in_group, None] * n_cols + np.arange(n_cols)) * 7 + codes[in_group]
+        chunk_counts = np.bincount(bins.ravel(), minlength=n_values * n_cols * 7).reshape(n_values, n_cols, 7)
+        for i, value in enumerate(values):
+            counts[position[value]] += chunk_counts[i]
+
+        if suggestion_col is not None:
+            answers = chunk[suggestion_col]
+            answered = answers.notna().to_numpy()
+            for i, value in enumerate(values):
+                items = answers[answered & (group_codes == i)].astype(str).tolist()
+                _reservoir_add(samples[value], seen[value], items, rng, sample_size)
+                seen[value] += len(items)
+
+    if profile is None:
+        raise ValueError("Error reading uploaded file: no data rows")
+    return StreamedUpload(
+        profile=profile,
+        head=head,
+        columns=columns,
+        groups=list(position),
+        counts=np.stack(counts) if counts else np.zeros((0, len(columns), 7), dtype=np.int64),
+        samples=samples,
+        suggestion_column=suggestion_col
+    )
+
+def _stream_and_groups(source, group_col, feedback_type, category_detector, content_hash=None):
+    with span('stream_aggregate') as timing:
+        streamed = aggregate_csv_stream(source, group_col)
+        timing.set(rows=streamed.profile.rows, groups=len(streamed.groups))
+    stored = load_profile(content_hash) if content_hash else None
+    if stored:
+        streamed.profile.category_groups = stored.category_groups
+    # Categories are detected on the first rows, then checked against the whole-file profile
+    profile, category_groups, detector = _profile_and_groups(streamed.head, feedback_type, category_detector,
+                                                             streamed.profile, content_hash)
+    return streamed, profile, category_groups, detector
+
+# Worker processes used for per-group reports (choice '2'); 1 keeps everything in-process
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', '1'))
+
+# One spawn pool per process, started on first use and kept, so requests after the first
+# do not wait for fresh workers to import pandas, matplotlib and genai
+_report_pool = None
+_report_pool_workers = None
+_report_pool_lock = threading.Lock()
+
+def _get_report_pool(workers):
+    global _report_pool, _report_pool_workers
+    with _report_pool_lock:
+        if _report_pool is not None and _report_pool_workers != workers:
+            # Groups already submitted to the old pool still finish
+            _report_pool.shutdown(wait=False)
+            _report_pool = None
+        if _report_pool is None:
+            _report_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _report_pool_workers = workers
+        return _report_pool
+
+def _drop_report_pool(pool):
+    # A pool whose worker died is unusable; the next request builds a new one
+    global _report_pool
+    with _report_pool_lock:
+        if _report_pool is pool:
+            _report_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _build_group_report(feedback_type, group_col, value, group_df, category_groups, group_histogram, suggestion_summary,
+                        chart_scope=None):
+    with span('pdf_layout', groups=1) as timing:
+        if feedback_type == 'stakeholder':
+            report = generate_stakeholder_report(group_df, group_col, value, category_groups, group_histogram, suggestion_summary,
+                                                 chart_scope=chart_scope)
+        else:
+            report = generate_subject_report(group_df, group_col, value, category_groups, group_histogram, chart_scope)
+        timing.set(bytes=len(report[1]))
+    return report
+
+def _group_report_jobs(df, group_col, category_groups, feedback_type, summarizer, profile, streamed):
+    if streamed is None:
+        histogram = compute_likert_histograms(df, category_groups, group_col, profile)
+        positions = group_positions(df[group_col])
+        values = list(positions)
+    else:
+        values = sorted(streamed.groups)
+        histogram = streamed.histogram(category_groups, values)
+
+    # All groups' suggestion summaries go to Gemini concurrently, up front
+    summaries = {}
+    suggestion_col = next((col for col in df.columns if 'suggestion' in col.lower()), None)
+    if feedback_type == 'stakeholder' and suggestion_col:
+        if streamed is None:
+            suggestions = df[suggestion_col]
+            summaries = summarize_suggestions_for_groups(
+                [(value, suggestions.iloc[rows].to_frame()) for value, rows in positions.items()],
+                suggestion_col, summarizer
+            )
+        else:
+            summaries = streamed.summaries(values, summarizer)
+
+    # With counts and summaries computed, the builders only read column names
+    # off the frame, so no per-group copy of the rows is made (or pickled)
+    frame = df.iloc[:0]
+    return [
+        (feedback_type, group_col, value, frame, category_groups, histogram_for_group(histogram, value), summaries.get(value))
+        for value in values
+    ]
+
+def _run_group_reports(jobs, group_col, workers, progress):
+    """Build one PDF per _group_report_jobs entry, fanned out over a process pool when workers > 1.
+
+    Yields (value, (pdf_name, pdf_bytes), None) for each group in job order,
+    as soon as that group and all before it are done, or (value, None, error)
+    for a group that raised. Processes rather than threads because pyplot
+    keeps global figure state. progress(value, done, total) is called as each
+    group finishes; if it raises, pending groups are dropped and the
+    exception propagates.
+    """
+    done = 0
+
+    def outcome(value, run):
+        nonlocal done
         try:
-            df = pd.read_excel(file_bytes)
-        except Exception:
-            file_bytes.seek(0)
-            df = pd.read_csv(file_bytes)
-    except Exception as e:
-        raise ValueError(f"Error reading uploaded file: {e}")
+            result = (value, run(), None)
+        except Exception as e:
+            print(f"Report for {group_col} '{value}' failed: {e}")
+            result = (value, None, e)
+        done += 1
+        if progress:
+            progress(value, done, len(jobs))
+        return result
+
+    if workers > 1 and len(jobs) > 1:
+        pool = _get_report_pool(workers)
+        try:
+            futures = {pool.submit(_build_group_report, *job): i for i, job in enumerate(jobs)}
+        except BrokenProcessPool:
+            _drop_report_pool(pool)
+            pool = _get_report_pool(workers)
+            futures = {pool.submit(_build_group_report, *job): i for i, job in enumerate(jobs)}
+        # Finished groups wait here until every earlier group has been yielded, so the
+        # ZIP keeps groupby order whatever order the workers finish in
+        ready, next_index = {}, 0
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                if isinstance(future.exception(), BrokenProcessPool):
+                    _drop_report_pool(pool)
+                ready[i] = outcome(jobs[i][2], future.result)
+                while next_index in ready:
+                    yield ready.pop(next_index)
+                    next_index += 1
+        except BaseException:
+            # Includes GeneratorExit when the consumer (e.g. a disconnected client) stops early;
+            # the pool is shared, so only this request's groups are cancelled
+            for future in futures:
+                future.cancel()
+            raise
+    else:
+        for job in jobs:
+            yield outcome(job[2], lambda: _build_group_report(*job))
+
+class _ZipChunks(RawIOBase):
+    """Write-only, unseekable sink: zipfile writes data descriptors and the bytes are drained as they come."""
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+def _zip_stream(outcomes, save_dir=None):
+    sink = _ZipChunks()
+    written, failures = 0, []
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for value, report, error in outcomes:
+            if error is not None:
+                failures.append((value, error))
+                continue
+            pdf_name, data = report
+            with span('zip', bytes=len(data)):
+                zipf.writestr(pdf_name, data)
+            written += 1
+            if save_dir:
+                os.makedirs(save_dir, exist_ok=True)
+                with open(os.path.join(save_dir, pdf_name), 'wb') as f:
+                    f.write(data)
+            yield sink.drain()
+        if failures:
+            if not written:
+                raise ValueError(f"Report generation failed for every group: {failures[0][1]}")
+            zipf.writestr('failed_groups.txt', "".join(f"{value}: {error}\n" for value, error in failures))
+    yield sink.drain()
+
+class ReportStream:
+    """What stream_feedback returns: iterate it for the bytes of the report ZIP.
+
+    degraded is true if a group's report failed, a suggestion summary is a
+    fallback (see FALLBACK_SUMMARIES) or the categories came from the local
+    detector standing in for Gemini; it is only final once the iteration
+    has finished. Such a ZIP should be served but not cached.
+    """
+    def __init__(self, outcomes, save_dir=None, degraded=False):
+        self.degraded = degraded
+        self._chunks = _zip_stream(self._watch(outcomes), save_dir)
 
-    # Detect Likert categories based on feedback type
-    if feedback_type == 'stakeholder':
-        category_groups_raw = group_columns_by_category(df)
-        category_groups = {}
-        for category, cols in category_groups_raw.items():
-            likert_cols = []
-            for col in cols:
-                if col in df.columns:
-                    numeric_vals = pd.to_numeric(df[col], errors='coerce').dropna()
-                    if not numeric_vals.empty and numeric_vals.between(1, 5).all():
-                        likert_cols.append(col)
-            if likert_cols:
-                category_groups[category] = likert_cols
-    else:  # subject feedback
-        category_map = detect_likert_categories_with_gemini_subject(df)
-        category_groups = {}
-        for question, category in category_map.items():
-            if question in df.columns:
-                if df[question].dropna().apply(lambda x: str(x).strip().isdigit()).all():
-                    category_groups.setdefault(category.strip(), []).append(question)
+    def _watch(self, outcomes):
+        for outcome in outcomes:
+            if outcome[2] is not None:
+                self.degraded = True
+            yield outcome
+
+    def __iter__(self):
+        return self._chunks
+
+def stream_feedback(file_bytes, filename, choice, feedback_type='stakeholder', save_to_disk=False, workers=None, progress=None,
+                    summarizer=DEFAULT_SUMMARIZER, category_detector=DEFAULT_CATEGORY_DETECTOR, profile=None, content_hash=None):
+    """
+    Return a ReportStream over the bytes of the report ZIP, each group's PDF
+    written to it as soon as that PDF is built.
+
+    Loading, profiling, counting and summarizing happen before this returns,
+    so bad input raises here rather than after the first bytes went out. PDFs
+    are only kept in memory; save_to_disk also writes them to feedback_catalyst/.
+    If every group fails, the iterator raises ValueError instead of finishing
+    the archive.
+    """
+    streamed = None
+    if should_stream(file_bytes, filename):
+        # Too large to load: aggregate in chunks, grouped the way the choice needs
+        group_col = find_group_column(read_headers(file_bytes, filename)) if choice == '2' else None
+        streamed, profile, category_groups, detector = _stream_and_groups(file_bytes, group_col, feedback_type,
+                                                                          category_detector, content_hash)
+        df = streamed.frame()
+    else:
+        df, profile = _load_frame(file_bytes, filename, feedback_type, category_detector, profile, content_hash)
 
-    output_pdfs = []
+        # Detect Likert categories based on feedback type
+        profile, category_groups, detector = _profile_and_groups(df, feedback_type, category_detector, profile,
+                                                                 content_hash)
+        df = normalize_frame(df, profile)
 
     # Interpret choice
     if choice == '1':
         # No grouping – overall report
-        if feedback_type == 'stakeholder':
-            pdf_path = generate_stakeholder_report(df, 'Overall', 'All Students', category_groups)
+        if streamed is None:
+            histogram = compute_likert_histograms(df, category_groups, profile=profile)
+            suggestion_col = next((col for col in df.columns if 'suggestion' in col.lower()), None)
+            summary = None
+            if feedback_type == 'stakeholder' and suggestion_col:
+                summary = summarize_suggestions_for_groups([(OVERALL_GROUP, df)], suggestion_col,
+                                                           summarizer)[OVERALL_GROUP]
         else:
-            pdf_path = generate_subject_report(df, 'Overall', 'All Students', category_groups)
-        output_pdfs.append(pdf_path)
+            histogram = streamed.histogram(category_groups)
+            summary = streamed.summaries([OVERALL_GROUP], summarizer).get(OVERALL_GROUP)
+        histogram = histogram_for_group(histogram, OVERALL_GROUP)
+        with span('pdf_layout', groups=1) as timing:
+            if feedback_type == 'stakeholder':
+                report = generate_stakeholder_report(df, 'Overall', 'All Students', category_groups, histogram, summary,
+                                                     summarizer=summarizer)
+            else:
+                report = generate_subject_report(df, 'Overall', 'All Students', category_groups, histogram)
+            timing.set(bytes=len(report[1]))
+        if progress:
+            progress('All Students', 1, 1)
+        outcomes = [('All Students', report, None)]
+        degraded = summary in FALLBACK_SUMMARIES
 
     elif choice == '2':
-        # Group by branch/department
-        possible_group_cols = ['Branch', 'Department', 'Subject', 'Faculty', 'Class']  # customize as per your sheet
-        group_col = next((col for col in df.columns if col.strip().lower() in [x.lower() for x in possible_group_cols]), None)
+        # Group by branch/department (see dataset_profile.GROUP_COLUMN_NAMES)
+        group_col = profile.group_column
 
         if not group_col:
             raise ValueError("No valid grouping column (e.g., 'Branch', 'Department') found in the file.")
 
-        for value, group_df in df.groupby(group_col):
-            if feedback_type == 'stakeholder':
-                pdf_path = generate_stakeholder_report(group_df, group_col, value, category_groups)
-            else:
-                pdf_path = generate_subject_report(group_df, group_col, value, category_groups)
-            output_pdfs.append(pdf_path)
+        jobs = _group_report_jobs(df, group_col, category_groups, feedback_type, summarizer, profile, streamed)
+        degraded = any(job[6] in FALLBACK_SUMMARIES for job in jobs)
+        outcomes = _run_group_reports(jobs, group_col, REPORT_WORKERS if workers is None else workers, progress)
 
     else:
         raise ValueError("Invalid choice. Must be '1' or '2'.")
 
-    # Create ZIP archive in memory
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for pdf_path in output_pdfs:
-            arcname = os.path.basename(pdf_path)
-            with open(pdf_path, 'rb') as f:
-                zipf.writestr(arcname, f.read())
+    # Categories from a fallback detector are served too, but not cached as the requested detector's
+    return ReportStream(outcomes, "feedback_catalyst" if save_to_disk else None, degraded or detector != category_detector)
 
+def process_feedback(file_bytes, filename, choice, feedback_type='stakeholder', save_to_disk=False, save_chart_fn=None, workers=None, progress=None,
+                     summarizer=DEFAULT_SUMMARIZER, category_detector=DEFAULT_CATEGORY_DETECTOR, profile=None, content_hash=None):
+    """stream_feedback collected into a BytesIO ZIP."""
+    zip_buffer = BytesIO()
+    for chunk in stream_feedback(file_bytes, filename, choice, feedback_type, save_to_disk, workers, progress,
+                                 summarizer, category_detector, profile, content_hash):
+        zip_buffer.write(chunk)
     zip_buffer.seek(0)
-
-    # Clean up
-    if not save_to_disk:
-        for pdf_path in output_pdfs:
-            if os.path.exists(pdf_path):
-                os.remove(pdf_path)
-
     return zip_buffer
 
 
+def _group_charts(sub_df, category_groups, feedback_type, title_prefix, histogram, scope):
+    # One stored chart per category with answers; returns the chart filenames
+    chart_files = []
+    for category, cols in category_groups.items():
+        valid_cols = [col for col in cols if col in sub_df.columns]
+        if not valid_cols:
+            continue
+        summary_df = generate_summary_table(sub_df, valid_cols, feedback_type, histogram)
+        if not summary_df.empty:
+            chart_file = plot_ratings(summary_df, category, title_prefix, feedback_type, scope)
+            if chart_file:
+                chart_files.append(chart_file)
+    return chart_files
+
+def _chart_histograms(file_path, choice, feedback_type, category_detector, profile, content_hash, filename):
+    # Load an upload the way the chart views read it: (frame with the question columns, category_groups,
+    # branch column or None for the overall view, [(branch or OVERALL_GROUP, its histogram slice), ...],
+    # category detector that ran)
+    if filename is None and isinstance(file_path, str):
+        filename = file_path
+    streamed = None
+    if should_stream(file_path, filename):
+        # Too large to load: aggregate in chunks, by branch when the choice needs it
+        group_col = find_branch_column(read_headers(file_path, filename)) if choice == "2" else None
+        streamed, profile, category_groups, detector = _stream_and_groups(file_path, group_col, feedback_type,
+                                                                          category_detector, content_hash)
+        df = streamed.frame()
+    else:
+        df, profile = _load_frame(file_path, filename, feedback_type, category_detector, profile, content_hash)
+
+        # Group questions by categories
+        profile, category_groups, detector = _profile_and_groups(df, feedback_type, category_detector, profile,
+                                                                 content_hash)
+        df = normalize_frame(df, profile)
 
-def process_for_charts(file_path, choice, feedback_type='stakeholder', save_chart_fn=None):
+    # Detect grouping column like 'Branch'
+    branch_col = profile.branch_column if choice == "2" else None
+    if branch_col:
+        if streamed is None:
+            histogram = compute_likert_histograms(df, category_groups, branch_col, profile)
+            branches = df[branch_col].dropna().unique()
+        else:
+            histogram = streamed.histogram(category_groups)
+            branches = streamed.groups
+    else:
+        if streamed is None:
+            histogram = compute_likert_histograms(df, category_groups, profile=profile)
+        else:
+            histogram = streamed.histogram(category_groups)
+        branches = [OVERALL_GROUP]
+    # The branches' counts come from the histogram; df only supplies column names
+    return (df, category_groups, branch_col, [(branch, histogram_for_group(histogram, branch)) for branch in branches],
+            detector)
+
+def process_for_charts(file_path, choice, feedback_type='stakeholder', save_chart_fn=None, progress=None,
+                       category_detector=DEFAULT_CATEGORY_DETECTOR, profile=None, content_hash=None, filename=None,
+                       job_id=None):
     """
-    Generates charts for feedback analysis and returns a list of chart filenames.
-    Works with a file path (Excel or CSV).
+    Generates charts for feedback analysis and returns (chart filenames, category
+    detector that ran: category_detector unless Gemini fell back to 'local').
+    Works with a file path (Excel or CSV) or a seekable binary file object,
+    e.g. a stored upload; filename is then its original name.
+    progress(value, done, total) is called after each branch's charts are stored.
+    Chart names are qualified by content_hash and job_id (a fresh id if none),
+    see chart_store.ChartScope.
     """
+    df, category_groups, branch_col, branches, detector = _chart_histograms(
+        file_path, choice, feedback_type, category_detector, profile, content_hash, filename
+    )
+    chart_files = []
+    scope = ChartScope.new(content_hash, job_id)
 
-    # Try reading Excel or fallback to CSV
-    try:
-        df = pd.read_excel(file_path)
-    except Exception:
-        try:
-            df = pd.read_csv(file_path)
-        except Exception as e:
-            raise ValueError(f"Error reading uploaded file: {e}")
+    for done, (branch, histogram) in enumerate(branches, 1):
+        name, value = ("Branch", branch) if branch_col else ("Overall", "All_Students")
+        chart_files.extend(_group_charts(df, category_groups, feedback_type, f"{name}_{value}", histogram, scope))
+        if progress:
+            progress(value, done, len(branches))
 
-    # Group questions by categories
-    if feedback_type == 'stakeholder':
-        category_groups_raw = group_columns_by_category(df)
-        category_groups = {}
-        for category, cols in category_groups_raw.items():
-            likert_cols = []
-            for col in cols:
-                if col in df.columns:
-                    numeric_vals = pd.to_numeric(df[col], errors='coerce').dropna()
-                    if not numeric_vals.empty and numeric_vals.between(1, 5).all():
-                        likert_cols.append(col)
-            if likert_cols:
-                category_groups[category] = likert_cols
-    else:  # subject feedback
-        category_map = detect_likert_categories_with_gemini_subject(df)
-        category_groups = {}
-        for question, category in category_map.items():
-            if question in df.columns:
-                if df[question].dropna().apply(lambda x: str(x).strip().isdigit()).all():
-                    category_groups.setdefault(category.strip(), []).append(question)
+    return chart_files, detector
 
-    # Detect grouping column like 'Branch'
-    branch_col = next((col for col in df.columns if "branch" in col.lower()), None)
-    chart_files = []
+def chart_data(file_path, choice, feedback_type='stakeholder', category_detector=DEFAULT_CATEGORY_DETECTOR,
+               profile=None, content_hash=None, filename=None):
+    """
+    The numbers process_for_charts draws, as a JSON-ready dict, so a client
+    can render the charts itself; nothing is plotted or stored.
 
-    # Helper to generate and collect charts
-    def generate_and_collect_charts(sub_df, name, value):
+    Every group (each branch, or OVERALL_GROUP) lists its categories with the
+    generate_summary_table rows: question labels, Total, and the counts and
+    percentages of each score in `scores` order. category_detector is the
+    detector that ran ('local' when Gemini was asked for but fell back).
+    """
+    df, category_groups, branch_col, branches, detector = _chart_histograms(
+        file_path, choice, feedback_type, category_detector, profile, content_hash, filename
+    )
+    groups = []
+    for branch, histogram in branches:
+        categories = []
         for category, cols in category_groups.items():
-            valid_cols = [col for col in cols if col in sub_df.columns]
+            valid_cols = [col for col in cols if col in df.columns]
             if not valid_cols:
                 continue
-            summary_df = generate_summary_table(sub_df, valid_cols, feedback_type)
-            if not summary_df.empty:
-                chart_file = plot_ratings(summary_df, category, f"{name}_{value}", feedback_type)
-                if chart_file:
-                    chart_files.append(chart_file)
-
-    # Chart generation based on choice
-    if choice == "1":
-        generate_and_collect_charts(df, "Overall", "All_Students")
-    elif choice == "2" and branch_col:
-        for branch in df[branch_col].dropna().unique():
-            branch_df = df[df[branch_col] == branch]
-            generate_and_collect_charts(branch_df, "Branch", branch)
-    else:
-        generate_and_collect_charts(df, "Overall", "All_Students")
+            table = generate_summary_table(df, valid_cols, feedback_type, histogram)
+            if table.empty:
+                continue
+            categories.append({
+                'category': category,
+                'questions': table['Category'].tolist(),
+                'totals': table['Total'].astype(int).tolist(),
+                'counts': table[LIKERT_SCORES].astype(int).values.tolist(),
+                'percents': table[[f"% of {i}" for i in LIKERT_SCORES]].astype(float).values.tolist()
+            })
+        groups.append({'group': histogram_store.plain(branch), 'categories': categories})
+    return {'feedback_type': feedback_type, 'category_detector': detector, 'group_column': branch_col,
+            'scores': LIKERT_SCORES, 'groups': groups}
+
+def _dataset_columns(dataset):
+    # Everything an append reads off an export: the questions, grouping and suggestion columns
+    questions = [col for cols in dataset['category_groups'].values() for col in cols]
+    extra = [dataset['group_column'], dataset['suggestion_column']]
+    return list(dict.fromkeys(questions + [col for col in extra if col]))
+
+def _row_fingerprint(row):
+    # The same for a row whose column was inferred as 3, 3.0 or '3' in another parse of the export
+    parts = []
+    for value in row:
+        if pd.isna(value):
+            parts.append('')
+            continue
+        number = pd.to_numeric(str(value).strip(), errors='coerce')
+        parts.append(repr(float(number)) if not pd.isna(number) else str(value).strip())
+    return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+def _batch_samples(dataset, rows, groups, sample_size):
+    # A reservoir sample of each touched group's new suggestion answers, for the pending batch
+    col, group_col = dataset['suggestion_column'], dataset['group_column']
+    answers = rows[col]
+    keys = rows[group_col] if group_col else pd.Series(OVERALL_GROUP, index=rows.index)
+    rng = np.random.default_rng()
+    batch = []
+    for group in groups:
+        items = answers[(keys == group) & answers.notna()].astype(str).tolist()
+        samples = []
+        _reservoir_add(samples, 0, items, rng, sample_size)
+        batch.append({'group': group, 'samples': samples, 'seen': len(items)})
+    return batch
+
+def _apply_samples(dataset_id, pending, sample_size):
+    # Merge the batch's samples into the stored ones; groups that already have this batch are skipped
+    version = pending['version']
+    rng = np.random.default_rng(version)
+    for entry in pending['samples']:
+        samples, seen, merged = histogram_store.load_sample_batch(dataset_id, entry['group'])
+        if merged >= version:
+            continue
+        samples = _reservoir_merge(samples, seen, entry['samples'], entry['seen'], rng, sample_size)
+        histogram_store.save_samples(dataset_id, entry['group'], samples, seen + entry['seen'], version)
 
-    return chart_files   
\ No newline at end of file
+def _chart_names(frame, category_groups, feedback_type, title_prefix, histogram, scope):
+    # Names the report builders store a group's charts under when given chart_scope=scope
+    names = []
+    for category, cols in category_groups.items():
+        valid_cols = [col for col in cols if col in frame.columns]
+        if valid_cols and not generate_summary_table(frame, valid_cols, feedback_type, histogram).empty:
+            names.append(scope.filename(chart_filename(category, title_prefix)))
+    return names
+
+def _rebuild_groups(dataset, groups, workers, summarizer):
+    # Charts and PDFs of groups from the stored counts alone; returns (rebuilt, failures)
+    dataset_id, feedback_type = dataset['dataset_id'], dataset['feedback_type']
+    category_groups, suggestion_col = dataset['category_groups'], dataset['suggestion_column']
+    questions = list(dict.fromkeys(col for cols in category_groups.values() for col in cols))
+    samples = histogram_store.load_samples(dataset_id, groups) if suggestion_col else {}
+    stored = StreamedUpload(
+        profile=None,
+        head=pd.DataFrame(columns=_dataset_columns(dataset)),
+        columns=questions,
+        groups=groups,
+        counts=histogram_store.load_counts(dataset_id, groups, questions),
+        samples={group: answers for group, (answers, _) in samples.items()},
+        suggestion_column=suggestion_col
+    )
+    histogram = stored.histogram(category_groups)
+    summaries = stored.summaries(groups, summarizer)
+    frame = stored.frame()
+    name = dataset['group_column'] or 'Overall'
+
+    # Dataset ids are client-chosen, so charts are scoped by a hash of the id (ChartScope keeps 12 characters).
+    # The report builders store the charts they draw for the PDF, so each is drawn once. They are pinned:
+    # a group's report lists them until its next rebuild, however long the form stays open
+    scope = ChartScope(hashlib.sha256(dataset_id.encode('utf-8')).hexdigest(), f"v{dataset['version']}", pinned=True)
+    jobs = [(feedback_type, name, group, frame, category_groups, histogram_for_group(histogram, group),
+             summaries.get(group), scope)
+            for group in groups]
+    rebuilt, failures = [], []
+    for group, report, error in _run_group_reports(jobs, name, REPORT_WORKERS if workers is None else workers, None):
+        if error is not None:
+            failures.append({'group': group, 'error': str(error)})
+            continue
+        pdf_name, data = report
+        charts = _chart_names(frame, category_groups, feedback_type, f"{name}_{group}",
+                              histogram_for_group(histogram, group), scope)
+        histogram_store.store_report(dataset_id, group, pdf_name, data, dataset['version'], charts)
+        rebuilt.append({'group': group, 'report': pdf_name, 'charts': charts})
+    return rebuilt, failures
+
+def _finish_batch(dataset, workers, summarizer, sample_size):
+    # Apply the dataset's pending batch and rebuild its groups; safe to repeat after a failure part way
+    pending = dataset['pending']
+    histogram_store.apply_counts(dataset['dataset_id'], pending)
+    if pending['samples']:
+        _apply_samples(dataset['dataset_id'], pending, sample_size)
+    rebuilt, failures = _rebuild_groups(dataset, pending['groups'], workers, summarizer)
+    histogram_store.finish_pending(dataset['dataset_id'], pending['version'])
+    return rebuilt, failures
+
+def append_feedback(dataset_id, file_bytes, filename, feedback_type='stakeholder', cumulative=True, workers=None,
+                    summarizer=DEFAULT_SUMMARIZER, category_detector=DEFAULT_CATEGORY_DETECTOR,
+                    sample_size=SUGGESTION_SAMPLE_SIZE):
+    """
+    Count only the rows of an export that dataset_id has not counted yet and
+    rebuild the charts and PDFs of the groups those rows fall in.
+
+    A cumulative export (everything collected so far) has its first rows, up
+    to the dataset's watermark, skipped after checking that the last of them
+    is the row counted last; otherwise every row of the file is new. The
+    first append fixes the dataset's layout (feedback type, categories,
+    grouping column); later appends only read those columns. Returns
+    {'rows_added', 'rows', 'version', 'groups': [{'group', 'report', 'charts'}], 'failures'}.
+    Raises histogram_store.StaleWatermark if the export does not continue the
+    counted rows or another append moved the watermark first. A batch an
+    earlier append left pending (see histogram_store) is applied first.
+    """
+    dataset = histogram_store.get_dataset(dataset_id)
+    if dataset and dataset.get('pending'):
+        pending = dataset['pending']
+        print(f"Dataset '{dataset_id}': resuming rows {pending['from']}-{pending['to']} left pending by an earlier append")
+        _finish_batch(dataset, workers, summarizer, sample_size)
+        dataset = histogram_store.get_dataset(dataset_id)
+    with span('parse') as timing:
+        df = read_spreadsheet(file_bytes, filename, usecols=_dataset_columns(dataset) if dataset else None)
+        timing.set(rows=len(df), columns=len(df.columns))
+
+    if dataset is None:
+        profile, category_groups, _ = _profile_and_groups(df, feedback_type, category_detector)
+        if not category_groups:
+            raise ValueError("No Likert questions found in the file.")
+        suggestion_col = next((str(col) for col in df.columns if 'suggestion' in str(col).lower()), None)
+        dataset = histogram_store.create_dataset(dataset_id, feedback_type, category_groups, profile.group_column,
+                                                 suggestion_col if feedback_type == 'stakeholder' else None)
+    columns = _dataset_columns(dataset)
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise ValueError(f"The file is missing columns of dataset '{dataset_id}': {', '.join(missing)}")
+    df = df[[col for col in df.columns if col in columns]]
+
+    counted = dataset['rows']
+    skip = counted if cumulative else 0
+    if skip and (len(df) < skip or _row_fingerprint(df.iloc[skip - 1]) != dataset['last_row']):
+        raise histogram_store.StaleWatermark(
+            f"The export does not continue the {counted} rows already counted for dataset '{dataset_id}'"
+        )
+    new_rows = df.iloc[skip:]
+    if new_rows.empty:
+        return {'rows_added': 0, 'rows': counted, 'version': dataset['version'], 'groups': [], 'failures': []}
+
+    questions = list(dict.fromkeys(col for cols in dataset['category_groups'].values() for col in cols))
+    counts, groups = count_likert(new_rows, questions, dataset['group_column'])
+    entries, changed = histogram_store.batch_counts(groups, questions, counts)
+    samples = _batch_samples(dataset, new_rows, changed, sample_size) if dataset['suggestion_column'] else []
+    dataset = histogram_store.claim_rows(dataset, len(new_rows), _row_fingerprint(new_rows.iloc[-1]),
+                                         {'groups': changed, 'counts': entries, 'samples': samples})
+    print(f"Dataset '{dataset_id}': counted {len(new_rows)} new rows, rebuilding {len(changed)} groups")
+
+    rebuilt, failures = _finish_batch(dataset, workers, summarizer, sample_size)
+    return {'rows_added': len(new_rows), 'rows': dataset['rows'], 'version': dataset['version'],
+            'groups': rebuilt, 'failures': failures}
+
+def stream_dataset_reports(dataset_id):
+    """Bytes of a ZIP of every group's current report for dataset_id, as stream_feedback's iterator."""
+    return _zip_stream(histogram_store.stored_reports(dataset_id))
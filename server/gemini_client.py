@@ -0,0 +1,102 @@
+"""
+Gemini access layer: bounded concurrency, per-call deadlines, exponential
+backoff on rate limits and a circuit breaker.
+
+GeminiClient wraps any object with a `generate_content(prompt)` method whose
+result has a `.text` attribute, so a local fake model can stand in for the
+real one offline.
+"""
+import os, time, random, asyncio, threading
+from concurrent.futures import ThreadPoolExecutor
+from telemetry import span
+
+GEMINI_CONCURRENCY = int(os.environ.get('GEMINI_CONCURRENCY', '4'))
+GEMINI_TIMEOUT = float(os.environ.get('GEMINI_TIMEOUT', '30'))
+GEMINI_MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', '3'))
+
+# google.api_core exception names worth retrying after a pause
+RETRYABLE_ERRORS = {'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable'}
+
+class GeminiUnavailable(Exception):
+    """Raised when a call fails for good or the circuit breaker is open."""
+
+def _is_retryable(error):
+    return type(error).__name__ in RETRYABLE_ERRORS or getattr(error, 'code', None) in (429, 503)
+
+class GeminiClient:
+    def __init__(self, model, max_concurrency=GEMINI_CONCURRENCY, timeout=GEMINI_TIMEOUT,
+                 max_retries=GEMINI_MAX_RETRIES, backoff=1.0, failure_threshold=5, reset_after=60.0):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+        # Own pool rather than asyncio's default one, so a call that outlives its
+        # deadline is abandoned instead of being waited for when the loop closes
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix='gemini')
+
+    def _breaker_allows(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_after:
+                # Half-open: let calls through again; one more failure re-opens it
+                self._opened_at = None
+                self._failures = self.failure_threshold - 1
+                return True
+            return False
+
+    def _record(self, ok):
+        with self._lock:
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+
+    async def _call(self, prompt, semaphore):
+        if not self._breaker_allows():
+            raise GeminiUnavailable("Gemini circuit breaker is open")
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    with span('gemini.call', prompt_chars=len(prompt)):
+                        call = asyncio.get_running_loop().run_in_executor(self._executor, self.model.generate_content, prompt)
+                        response = await asyncio.wait_for(call, self.timeout)
+                text = response.text.strip()
+                self._record(True)
+                return text
+            except Exception as e:
+                if _is_retryable(e) and attempt < self.max_retries:
+                    await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random() / 2))
+                    continue
+                self._record(False)
+                if isinstance(e, asyncio.TimeoutError):
+                    raise GeminiUnavailable(f"Gemini call timed out after {self.timeout}s") from e
+                raise GeminiUnavailable(str(e)) from e
+
+    def generate(self, prompt):
+        """Run one prompt; raises GeminiUnavailable on failure."""
+        return asyncio.run(self._call(prompt, asyncio.Semaphore(1)))
+
+    def generate_many(self, prompts):
+        """Run prompts concurrently (up to max_concurrency); failed ones come back as None."""
+        async def run_all():
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            return await asyncio.gather(*(self._call(p, semaphore) for p in prompts), return_exceptions=True)
+
+        if not prompts:
+            return []
+        results = asyncio.run(run_all())
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Gemini call failed: {result}")
+        return [None if isinstance(result, Exception) else result for result in results]
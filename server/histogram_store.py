@@ -0,0 +1,195 @@
+"""
+Persisted Likert counts for incrementally updated reports.
+
+A dataset is a feedback form whose export keeps growing, registered under a
+client-chosen id. `histogram_datasets` holds its layout (feedback type,
+category groups, grouping and suggestion columns), a watermark of how many
+export rows have been counted and a fingerprint of the last counted row.
+`histogram_counts` has one document per (dataset, group, question) whose
+`counts` are the likert_codes tallies ('0'-'6'), merged with $inc as rows
+arrive; `histogram_samples` keeps each group's reservoir sample of
+suggestion answers. The latest PDF of every group is kept in the
+`group_reports` GridFS bucket, replacing the one before; its charts are
+pinned in chart_store and deleted along with the report they belong to.
+
+Moving the watermark and merging the counts are not one write, so an
+append first records its batch (row range, tallies, sampled answers) as
+`pending` on the dataset in the same update that moves the watermark, then
+applies it. Count and sample documents remember the last batch (dataset
+version) merged into them, so a batch left pending by a failed append can
+be applied again without counting anything twice.
+"""
+from datetime import datetime, timezone
+import numpy as np
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+import gridfs
+import chart_store
+
+# MongoDB setup
+client = MongoClient('mongodb://localhost:27017/')
+db = client['feedback_db']
+datasets_collection = db['histogram_datasets']
+counts_collection = db['histogram_counts']
+samples_collection = db['histogram_samples']
+fs_reports = gridfs.GridFS(db, collection='group_reports')
+
+LIKERT_CODES = 7
+
+_indexes_ready = False
+
+class StaleWatermark(Exception):
+    """The export does not continue from the rows already counted, or another append got there first."""
+    pass
+
+def _ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        datasets_collection.create_index('dataset_id', unique=True)
+        counts_collection.create_index([('dataset_id', 1), ('group', 1), ('question', 1)], unique=True)
+        samples_collection.create_index([('dataset_id', 1), ('group', 1)], unique=True)
+        _indexes_ready = True
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def plain(value):
+    # numpy scalars (group values from pd.factorize) are not BSON-encodable
+    return value.item() if isinstance(value, np.generic) else value
+
+def get_dataset(dataset_id):
+    _ensure_indexes()
+    return datasets_collection.find_one({'dataset_id': dataset_id})
+
+def create_dataset(dataset_id, feedback_type, category_groups, group_column, suggestion_column):
+    """Register a dataset with nothing counted yet; returns its document (the existing one if it is already there)."""
+    _ensure_indexes()
+    datasets_collection.update_one(
+        {'dataset_id': dataset_id},
+        {'$setOnInsert': {
+            'feedback_type': feedback_type,
+            'category_groups': category_groups,
+            'group_column': group_column,
+            'suggestion_column': suggestion_column,
+            'rows': 0,
+            'version': 0,
+            'last_row': None,
+            'created_at': _now()
+        }},
+        upsert=True
+    )
+    return get_dataset(dataset_id)
+
+def batch_counts(groups, questions, counts):
+    """A (group, question, likert code) tally array as pending-batch entries; returns (entries, groups that had any)."""
+    entries, changed = [], []
+    for g, group in enumerate(groups):
+        if not counts[g].any():
+            continue
+        changed.append(plain(group))
+        for q, question in enumerate(questions):
+            tallies = {str(code): int(n) for code, n in enumerate(counts[g, q]) if n}
+            if tallies:
+                entries.append({'group': plain(group), 'question': question, 'counts': tallies})
+    return entries, changed
+
+def claim_rows(dataset, added, last_row, batch):
+    """Move the watermark on by added rows and record batch as the dataset's pending batch; returns the updated dataset.
+
+    batch holds 'groups', 'counts' (batch_counts entries) and 'samples'
+    ([{'group', 'samples', 'seen'}]). Raises StaleWatermark if another
+    append moved the watermark first or left a batch pending, so two appends
+    of the same rows can never both be counted.
+    """
+    version = dataset['version'] + 1
+    pending = {**batch, 'version': version, 'from': dataset['rows'], 'to': dataset['rows'] + added}
+    doc = datasets_collection.find_one_and_update(
+        {'dataset_id': dataset['dataset_id'], 'rows': dataset['rows'], 'version': dataset['version'], 'pending': None},
+        {'$set': {'rows': dataset['rows'] + added, 'version': version, 'last_row': last_row,
+                  'pending': pending, 'updated_at': _now()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc is None:
+        raise StaleWatermark(f"Dataset '{dataset['dataset_id']}' was appended to concurrently; retry the append")
+    return doc
+
+def apply_counts(dataset_id, pending):
+    """$inc the pending batch's tallies into the stored counts, skipping documents that already have them."""
+    version = pending['version']
+    keys = [{'dataset_id': dataset_id, 'group': entry['group'], 'question': entry['question']}
+            for entry in pending['counts']]
+    if not keys:
+        return
+    # Create missing documents first so the conditional $inc below never needs an upsert
+    counts_collection.bulk_write([
+        UpdateOne(key, {'$setOnInsert': {'counts': {}, 'batch': 0}}, upsert=True) for key in keys
+    ], ordered=False)
+    counts_collection.bulk_write([
+        UpdateOne({**key, 'batch': {'$not': {'$gte': version}}},
+                  {'$inc': {f"counts.{code}": n for code, n in entry['counts'].items()}, '$set': {'batch': version}})
+        for key, entry in zip(keys, pending['counts'])
+    ], ordered=False)
+
+def finish_pending(dataset_id, version):
+    datasets_collection.update_one({'dataset_id': dataset_id, 'pending.version': version}, {'$unset': {'pending': ''}})
+
+def load_counts(dataset_id, groups, questions):
+    """The stored tallies of groups x questions as an int64 (group, question, code) array."""
+    counts = np.zeros((len(groups), len(questions), LIKERT_CODES), dtype=np.int64)
+    group_pos = {group: i for i, group in enumerate(groups)}
+    question_pos = {question: i for i, question in enumerate(questions)}
+    for doc in counts_collection.find({'dataset_id': dataset_id, 'group': {'$in': list(groups)}}):
+        q = question_pos.get(doc['question'])
+        if q is None:
+            continue
+        for code, n in doc.get('counts', {}).items():
+            counts[group_pos[doc['group']], q, int(code)] = n
+    return counts
+
+def load_samples(dataset_id, groups):
+    """{group: (sampled suggestion answers, answers seen)}; groups without any get ([], 0)."""
+    stored = {doc['group']: (doc['samples'], doc['seen'])
+              for doc in samples_collection.find({'dataset_id': dataset_id, 'group': {'$in': list(groups)}})}
+    return {group: stored.get(group, ([], 0)) for group in groups}
+
+def load_sample_batch(dataset_id, group):
+    """(sampled suggestion answers, answers seen, last batch merged) of a group, creating its document if needed."""
+    doc = samples_collection.find_one_and_update(
+        {'dataset_id': dataset_id, 'group': group},
+        {'$setOnInsert': {'samples': [], 'seen': 0, 'batch': 0}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc['samples'], doc['seen'], doc.get('batch', 0)
+
+def save_samples(dataset_id, group, samples, seen, batch):
+    """Store a group's sample with batch merged in, unless a concurrent resume of the batch got there first."""
+    samples_collection.update_one(
+        {'dataset_id': dataset_id, 'group': group, 'batch': {'$not': {'$gte': batch}}},
+        {'$set': {'samples': samples, 'seen': seen, 'batch': batch}}
+    )
+
+def store_report(dataset_id, group, pdf_name, data, version, charts):
+    """Keep data as the group's current PDF, deleting the one it replaces and that one's charts."""
+    previous = list(fs_reports.find({'dataset_id': dataset_id, 'group': group}))
+    fs_reports.put(data, filename=pdf_name, content_type='application/pdf', dataset_id=dataset_id, group=group,
+                   version=version, charts=charts)
+    replaced = {name for grid_out in previous for name in grid_out.charts} - set(charts)
+    if replaced:
+        chart_store.delete_charts(replaced)
+    for grid_out in previous:
+        fs_reports.delete(grid_out._id)
+
+def list_reports(dataset_id):
+    """Current report of every group, as JSON-friendly dicts sorted by group."""
+    reports = [
+        {'group': grid_out.group, 'filename': grid_out.filename, 'version': grid_out.version,
+         'charts': grid_out.charts, 'size': grid_out.length, 'created_at': grid_out.upload_date.isoformat()}
+        for grid_out in fs_reports.find({'dataset_id': dataset_id})
+    ]
+    return sorted(reports, key=lambda report: str(report['group']))
+
+def stored_reports(dataset_id):
+    """Yield (group, (pdf_name, pdf_bytes), None) for every current report, in the form _zip_stream takes."""
+    for report in list_reports(dataset_id):
+        grid_out = fs_reports.find_one({'dataset_id': dataset_id, 'group': report['group']})
+        if grid_out is not None:
+            yield report['group'], (grid_out.filename, grid_out.read()), None
@@ -0,0 +1,344 @@
+"""
+Background report/chart jobs.
+
+Job state lives in the `jobs` collection of feedback_db so any app worker can
+answer a status poll or a cancel request, while the work itself runs on a
+bounded local process pool (pyplot is not thread-safe).
+
+Each app process has an owner id and refreshes its row in `job_owners`
+while it lives; a running job refreshes its own heartbeat. Before jobs are
+counted against the limits, queued jobs of an owner that stopped
+heartbeating are taken over, and running jobs with a stale heartbeat are
+failed, so a restart or a killed worker never leaves a job active forever.
+"""
+import os, time, uuid, socket, threading, multiprocessing
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import MongoClient
+import gridfs
+
+import telemetry
+from feedback_processor import stream_feedback, process_for_charts, DEFAULT_CATEGORY_DETECTOR
+from summarizers import DEFAULT_SUMMARIZER
+import result_cache, uploads, chart_store
+
+# MongoDB setup
+client = MongoClient('mongodb://localhost:27017/')
+db = client['feedback_db']
+jobs_collection = db['jobs']
+owners_collection = db['job_owners']
+fs_results = gridfs.GridFS(db, collection='results')
+# Files sent with a job request, kept until the job ends so workers never get them pickled
+fs_inputs = gridfs.GridFS(db, collection='job_inputs')
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOBS_PER_CLIENT = int(os.environ.get('JOBS_PER_CLIENT', '2'))
+# Active jobs across all clients; beyond it new jobs are refused
+JOB_QUEUE_LIMIT = int(os.environ.get('JOB_QUEUE_LIMIT', '20'))
+JOB_HEARTBEAT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_SECONDS', '15'))
+# A job or owner not heard from for this long is considered dead
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', '120'))
+JOB_KINDS = ['report', 'charts']
+ACTIVE_STATUSES = ['queued', 'running']
+
+_executor = None
+_executor_lock = threading.Lock()
+_owner_heartbeat = None
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class JobCancelled(Exception):
+    pass
+
+class JobLimitExceeded(Exception):
+    pass
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def _drop_executor(executor):
+    # A pool whose worker died is unusable; the next submit builds a new one
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _release_input(job):
+    if job and job.get('input_id'):
+        fs_inputs.delete(job['input_id'])
+
+def _fail(oid, error, statuses=ACTIVE_STATUSES):
+    job = jobs_collection.find_one_and_update(
+        {'_id': oid, 'status': {'$in': statuses}},
+        {'$set': {'status': 'failed', 'error': error, 'finished_at': _now(), 'updated_at': _now()}}
+    )
+    _release_input(job)
+    return 1 if job else 0
+
+def _job_done(job_id, executor, future):
+    # Runs in the app process; run_job records its own outcome unless its worker process died
+    if future.cancelled():
+        _fail(ObjectId(job_id), "The job was dropped along with a broken worker pool; submit it again", ['queued'])
+        return
+    error = future.exception()
+    if isinstance(error, BrokenProcessPool):
+        print(f"Job {job_id} lost its worker process")
+        _drop_executor(executor)
+        _fail(ObjectId(job_id), "The worker process running this job exited unexpectedly")
+    elif error is not None:
+        _fail(ObjectId(job_id), str(error))
+
+def _dispatch(job_id, *args):
+    executor = _get_executor()
+    try:
+        future = executor.submit(run_job, job_id, *args)
+    except BrokenProcessPool:
+        _drop_executor(executor)
+        executor = _get_executor()
+        future = executor.submit(run_job, job_id, *args)
+    future.add_done_callback(lambda f: _job_done(job_id, executor, f))
+
+def _beat_owner():
+    owners_collection.update_one({'owner': OWNER}, {'$set': {'heartbeat_at': _now()}}, upsert=True)
+
+def _owner_loop():
+    while True:
+        try:
+            _beat_owner()
+            reap_stale_jobs()
+        except Exception as e:
+            print(f"Job owner heartbeat failed: {e}")
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+
+def _start_owner_heartbeat():
+    global _owner_heartbeat
+    if _owner_heartbeat is None:
+        _beat_owner()
+        _owner_heartbeat = threading.Thread(target=_owner_loop, name='job-owner', daemon=True)
+        _owner_heartbeat.start()
+
+def reap_stale_jobs():
+    """Take over or fail queued jobs of dead owners and fail running jobs whose heartbeat stopped."""
+    cutoff = _now() - timedelta(seconds=JOB_STALE_SECONDS)
+    alive = set(owners_collection.distinct('owner', {'heartbeat_at': {'$gt': cutoff}})) | {OWNER}
+    reaped = 0
+    for job in jobs_collection.find({'status': 'queued', 'owner': {'$nin': list(alive)}}):
+        if job.get('file_id') or job.get('input_id'):
+            # The job's data is in GridFS and outlives the process: run it here instead
+            taken = jobs_collection.find_one_and_update(
+                {'_id': job['_id'], 'status': 'queued', 'owner': job.get('owner')},
+                {'$set': {'owner': OWNER, 'updated_at': _now()}}
+            )
+            if taken:
+                print(f"Requeued job {job['_id']} of {job.get('owner')}")
+                _dispatch(str(job['_id']), job['kind'], job.get('input_id'), job['filename'], job['choice'],
+                          job['feedback_type'], job['summarizer'], job['category_detector'], job.get('file_id'))
+        else:
+            # Queued before job files were kept in GridFS: the bytes died with the process
+            reaped += _fail(job['_id'], "The server restarted before this job ran; submit it again", ['queued'])
+    stale_running = {'status': 'running', '$or': [{'heartbeat_at': {'$lt': cutoff}},
+                                                   {'heartbeat_at': {'$exists': False}, 'updated_at': {'$lt': cutoff}}]}
+    for job in jobs_collection.find(stale_running, {'_id': 1}):
+        reaped += _fail(job['_id'], "The worker running this job stopped responding", ['running'])
+    if reaped:
+        print(f"Failed {reaped} stale jobs")
+    return reaped
+
+def _to_object_id(job_id):
+    try:
+        return ObjectId(job_id)
+    except (InvalidId, TypeError):
+        return None
+
+def submit_job(kind, client_id, stream, filename, choice, feedback_type='stakeholder',
+               summarizer=DEFAULT_SUMMARIZER, category_detector=DEFAULT_CATEGORY_DETECTOR, file_id=None):
+    """Queue a report or chart job and return its id without waiting for it.
+
+    stream (a binary file object, e.g. the request's spooled upload) is
+    copied chunk by chunk into the job_inputs bucket for the worker to read
+    and deleted when the job ends. Pass file_id (a stored upload, see
+    uploads.py) instead to have the worker read that.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Invalid job kind: {kind}")
+
+    _start_owner_heartbeat()
+    reap_stale_jobs()
+    active = jobs_collection.count_documents({'client_id': client_id, 'status': {'$in': ACTIVE_STATUSES}})
+    if active >= JOBS_PER_CLIENT:
+        raise JobLimitExceeded(f"Client already has {active} active jobs (limit {JOBS_PER_CLIENT})")
+    queued = jobs_collection.count_documents({'status': {'$in': ACTIVE_STATUSES}})
+    if queued >= JOB_QUEUE_LIMIT:
+        raise JobLimitExceeded(f"The job queue is full ({queued} active jobs); try again later")
+
+    input_id = content_hash = None
+    if not file_id:
+        input_id, content_hash, _ = uploads.write_stream(fs_inputs, stream, filename, 'application/octet-stream')
+    job_id = jobs_collection.insert_one({
+        'kind': kind,
+        'client_id': client_id,
+        'owner': OWNER,
+        'status': 'queued',
+        'cancel_requested': False,
+        'filename': filename,
+        'file_id': file_id,
+        'input_id': input_id,
+        'sha256': content_hash,
+        'choice': choice,
+        'feedback_type': feedback_type,
+        'summarizer': summarizer,
+        'category_detector': category_detector,
+        'progress': {'done': 0, 'total': None, 'groups': []},
+        'created_at': _now(),
+        'updated_at': _now()
+    }).inserted_id
+
+    try:
+        _dispatch(str(job_id), kind, input_id, filename, choice, feedback_type, summarizer, category_detector, file_id)
+    except Exception as e:
+        _fail(job_id, f"Could not start the job: {e}")
+        raise
+    return str(job_id)
+
+def get_job(job_id):
+    """Return the job document with JSON-friendly ids, or None."""
+    oid = _to_object_id(job_id)
+    job = jobs_collection.find_one({'_id': oid}) if oid else None
+    if not job:
+        return None
+    job['job_id'] = str(job.pop('_id'))
+    job.pop('input_id', None)
+    if job.get('result_file_id'):
+        job['result_file_id'] = str(job['result_file_id'])
+    return job
+
+def get_job_result(job):
+    """Open the finished ZIP of a report job from GridFS."""
+    return fs_results.get(ObjectId(job['result_file_id']))
+
+def cancel_job(job_id):
+    """Cancel a queued job outright, or flag a running one to stop at its next group."""
+    oid = _to_object_id(job_id)
+    if not oid:
+        return None
+    _release_input(jobs_collection.find_one_and_update(
+        {'_id': oid, 'status': 'queued'},
+        {'$set': {'status': 'cancelled', 'cancel_requested': True, 'updated_at': _now()}}
+    ))
+    jobs_collection.update_one(
+        {'_id': oid, 'status': 'running'},
+        {'$set': {'cancel_requested': True, 'updated_at': _now()}}
+    )
+    return get_job(job_id)
+
+def _timings(token):
+    # Stage breakdown of the job, one entry per span name (names contain '.', so not used as keys)
+    return [{'span': name, **total} for name, total in telemetry.summarize(telemetry.end_trace(token)).items()]
+
+def run_job(job_id, kind, input_id, filename, choice, feedback_type,
+            summarizer=DEFAULT_SUMMARIZER, category_detector=DEFAULT_CATEGORY_DETECTOR, file_id=None):
+    """Worker-process entry point; records progress and the result on the job document."""
+    oid = ObjectId(job_id)
+    started = jobs_collection.find_one_and_update(
+        {'_id': oid, 'status': 'queued', 'cancel_requested': False},
+        {'$set': {'status': 'running', 'started_at': _now(), 'heartbeat_at': _now(), 'updated_at': _now()}}
+    )
+    if not started:
+        return
+    timing_token = telemetry.start_trace()
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(JOB_HEARTBEAT_SECONDS):
+            jobs_collection.update_one({'_id': oid, 'status': 'running'}, {'$set': {'heartbeat_at': _now()}})
+    threading.Thread(target=heartbeat, name=f'job-{job_id}-heartbeat', daemon=True).start()
+
+    def progress(value, done, total):
+        job = jobs_collection.find_one_and_update(
+            {'_id': oid},
+            {'$set': {'progress.done': done, 'progress.total': total, 'updated_at': _now()},
+             '$push': {'progress.groups': str(value)}},
+            projection={'cancel_requested': 1}
+        )
+        if job and job.get('cancel_requested'):
+            raise JobCancelled()
+
+    try:
+        if file_id:
+            meta = uploads.get_upload(file_id)
+            if not meta:
+                raise ValueError(f"Stored upload {file_id} not found")
+            source, content_hash = uploads.open_upload(meta), meta['sha256']
+        else:
+            source, content_hash = fs_inputs.get(input_id), started['sha256']
+        if kind == 'report':
+            cache_key = result_cache.cache_key(content_hash, kind, choice=choice, feedback_type=feedback_type,
+                                               summarizer=summarizer, category_detector=category_detector)
+            zip_bytes = result_cache.get_report(cache_key)
+            if zip_bytes is None:
+                report = stream_feedback(
+                    file_bytes=source,
+                    filename=filename,
+                    choice=choice,
+                    feedback_type=feedback_type,
+                    progress=progress,
+                    summarizer=summarizer,
+                    category_detector=category_detector,
+                    content_hash=content_hash
+                )
+                zip_bytes = b"".join(report)
+                # A ZIP with a failed group or a fallback summary is delivered but not cached, so a retry reruns it
+                if not report.degraded:
+                    result_cache.put_report(cache_key, zip_bytes)
+            result_file_id = fs_results.put(
+                zip_bytes,
+                filename=f"{job_id}.zip",
+                content_type='application/zip',
+                job_id=oid
+            )
+            result = {'result_file_id': result_file_id}
+        else:
+            cache_key = result_cache.cache_key(content_hash, kind, choice=choice, feedback_type=feedback_type,
+                                               category_detector=category_detector)
+            chart_filenames = result_cache.get_charts(cache_key, chart_store.charts_exist)
+            if chart_filenames is None:
+                chart_filenames, detector = process_for_charts(source, choice, feedback_type, progress=progress,
+                                                               category_detector=category_detector,
+                                                               content_hash=content_hash, filename=filename,
+                                                               job_id=job_id)
+                # Not cached when Gemini category detection fell back to the local detector
+                if detector == category_detector:
+                    result_cache.put_charts(cache_key, chart_filenames)
+            result = {'chart_filenames': chart_filenames}
+
+        jobs_collection.update_one(
+            {'_id': oid},
+            {'$set': {'status': 'done', 'finished_at': _now(), 'updated_at': _now(), **result,
+                      'timings': _timings(timing_token)}}
+        )
+    except JobCancelled:
+        jobs_collection.update_one(
+            {'_id': oid},
+            {'$set': {'status': 'cancelled', 'finished_at': _now(), 'updated_at': _now()}}
+        )
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        jobs_collection.update_one(
+            {'_id': oid},
+            {'$set': {'status': 'failed', 'error': str(e), 'finished_at': _now(), 'updated_at': _now(),
+                      'timings': _timings(timing_token)}}
+        )
+    finally:
+        stopped.set()
+        if input_id:
+            fs_inputs.delete(input_id)
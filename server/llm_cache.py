@@ -0,0 +1,83 @@
+"""
+Persistent memo of Gemini answers.
+
+Category maps are keyed on a fingerprint of the normalized column headers,
+so every upload of the same form template reuses one mapping; suggestion
+summaries are keyed on a hash of the exact text fed into the prompt.
+Entries expire through a TTL index after LLM_CACHE_TTL_SECONDS, and
+hit/miss counters are kept per namespace in `llm_cache_stats`.
+"""
+import os, re, json, hashlib
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient
+
+# MongoDB setup
+client = MongoClient('mongodb://localhost:27017/')
+db = client['feedback_db']
+llm_cache_collection = db['llm_cache']
+llm_cache_stats = db['llm_cache_stats']
+
+LLM_CACHE_TTL_SECONDS = int(os.environ.get('LLM_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+
+_indexes_ready = False
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def _ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        llm_cache_collection.create_index([('namespace', 1), ('key', 1)], unique=True)
+        llm_cache_collection.create_index('expires_at', expireAfterSeconds=0)
+        _indexes_ready = True
+
+def normalize_header(header):
+    return re.sub(r'\s+', ' ', str(header)).strip().lower()
+
+def header_fingerprint(columns):
+    """Order-insensitive hash of a form's column headers."""
+    headers = sorted(normalize_header(col) for col in columns)
+    return hashlib.sha256(json.dumps(headers).encode('utf-8')).hexdigest()
+
+def text_fingerprint(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def get(namespace, key):
+    """Return the cached value or None, counting the hit or miss."""
+    entry = llm_cache_collection.find_one({'namespace': namespace, 'key': key})
+    if entry:
+        expires_at = entry['expires_at']
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if expires_at <= _now():
+            entry = None
+    llm_cache_stats.update_one(
+        {'_id': namespace},
+        {'$inc': {'hits' if entry else 'misses': 1}},
+        upsert=True
+    )
+    return entry['value'] if entry else None
+
+def put(namespace, key, value):
+    _ensure_indexes()
+    llm_cache_collection.update_one(
+        {'namespace': namespace, 'key': key},
+        {'$set': {
+            'value': value,
+            'created_at': _now(),
+            'expires_at': _now() + timedelta(seconds=LLM_CACHE_TTL_SECONDS)
+        }},
+        upsert=True
+    )
+
+def invalidate(namespace=None):
+    """Drop every cached answer, or only those of one namespace. Returns the count removed."""
+    query = {'namespace': namespace} if namespace else {}
+    return llm_cache_collection.delete_many(query).deleted_count
+
+def stats():
+    counters = {doc['_id']: {'hits': doc.get('hits', 0), 'misses': doc.get('misses', 0)}
+                for doc in llm_cache_stats.find()}
+    for doc in llm_cache_collection.aggregate([{'$group': {'_id': '$namespace', 'entries': {'$sum': 1}}}]):
+        counters.setdefault(doc['_id'], {'hits': 0, 'misses': 0})['entries'] = doc['entries']
+    return counters
@@ -0,0 +1,123 @@
+"""
+Opt-in profiling of report and chart requests.
+
+A request runs under cProfile when it asks for it (a `profile=1` form field
+or query parameter) or is picked by PROFILE_SAMPLE_RATE (0, i.e. never, by
+default). The pstats dump goes into the `profiles` GridFS bucket with the
+endpoint, request parameters and upload hash; GET /profiles lists the
+stored profiles and GET /profiles/<id> downloads one, as a .pstats file or
+(?format=text) a printed report. A request that is not profiled runs
+exactly as before, with nothing wrapped.
+
+cProfile only sees the request's own thread: report worker processes and
+Gemini calls show up as the time spent waiting for them.
+"""
+import os, io, time, random, marshal, pstats, cProfile
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import MongoClient, DESCENDING
+import gridfs
+
+# MongoDB setup
+client = MongoClient('mongodb://localhost:27017/')
+db = client['feedback_db']
+fs_profiles = gridfs.GridFS(db, collection='profiles')
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '200'))
+SORT_KEYS = ['cumulative', 'tottime', 'ncalls', 'filename']
+
+def wanted(flag=None):
+    """True if the request asked to be profiled or was sampled."""
+    if str(flag).lower() in ('1', 'true', 'yes'):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+class Capture:
+    """One request's cProfile session: run() and iterate() add to it, save() stores it."""
+    def __init__(self, endpoint, **metadata):
+        self.profile_id = ObjectId()
+        self.endpoint = endpoint
+        self.metadata = metadata
+        self.profiler = cProfile.Profile()
+        self.seconds = 0.0
+        self.saved = False
+
+    def run(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        self.profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.profiler.disable()
+            self.seconds += time.perf_counter() - start
+
+    def iterate(self, iterable):
+        """Yield iterable's items, profiling only while each is produced; saves the profile at the end."""
+        iterator = iter(iterable)
+        error = None
+        try:
+            while True:
+                try:
+                    item = self.run(next, iterator)
+                except StopIteration:
+                    return
+                yield item
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.save(error)
+
+    def save(self, error=None):
+        if self.saved:
+            return
+        self.saved = True
+        self.profiler.create_stats()
+        fs_profiles.put(
+            marshal.dumps(self.profiler.stats),
+            _id=self.profile_id,
+            filename=f"{self.profile_id}.pstats",
+            content_type='application/octet-stream',
+            endpoint=self.endpoint,
+            seconds=round(self.seconds, 3),
+            error=repr(error) if error else None,
+            **self.metadata
+        )
+        _trim()
+
+def _trim():
+    for old in fs_profiles.find({}).sort('uploadDate', DESCENDING).skip(PROFILE_KEEP):
+        fs_profiles.delete(old._id)
+
+def list_profiles(limit=50):
+    """Newest stored profiles first, as JSON-friendly dicts."""
+    profiles = []
+    for grid_out in fs_profiles.find({}).sort('uploadDate', DESCENDING).limit(limit):
+        meta = {key: value for key, value in grid_out._file.items()
+                if key not in ('_id', 'chunkSize', 'length', 'uploadDate', 'md5', 'contentType')}
+        profiles.append({**meta, 'profile_id': str(grid_out._id), 'size': grid_out.length,
+                         'created_at': grid_out.upload_date.isoformat()})
+    return profiles
+
+def open_profile(profile_id):
+    """The stored profile as a GridOut, or None for an unknown or malformed id."""
+    try:
+        return fs_profiles.get(ObjectId(profile_id))
+    except (InvalidId, TypeError, gridfs.errors.NoFile):
+        return None
+
+class _LoadedStats:
+    # What pstats.Stats expects of a profiler: create_stats() and a stats dict
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+def profile_text(grid_out, sort='cumulative', limit=80):
+    """Printed pstats report of a stored profile."""
+    out = io.StringIO()
+    stats = pstats.Stats(_LoadedStats(marshal.loads(grid_out.read())), stream=out)
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,148 @@
+"""
+Content-addressed cache of finished reports and chart lists.
+
+Entries are keyed on the SHA-256 of the uploaded bytes plus the request
+parameters. Report ZIPs are kept in the `result_cache` GridFS bucket, chart
+filename lists and gzipped chart data inline on the metadata document. Entries expire after
+RESULT_CACHE_TTL_SECONDS and the least recently used ones are evicted once
+the stored ZIPs exceed RESULT_CACHE_MAX_BYTES.
+"""
+import os, hashlib
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import DuplicateKeyError
+from bson import Binary
+import gridfs
+
+# MongoDB setup
+client = MongoClient('mongodb://localhost:27017/')
+db = client['feedback_db']
+cache_collection = db['result_cache']
+fs_cache = gridfs.GridFS(db, collection='result_cache')
+
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+
+_indexes_ready = False
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def _ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        cache_collection.create_index('key', unique=True)
+        cache_collection.create_index([('last_used', ASCENDING)])
+        cache_collection.create_index([('expires_at', ASCENDING)])
+        _indexes_ready = True
+
+def cache_key(content_hash, kind, **params):
+    """Combine the upload's SHA-256 (as uploads.store_upload and hash_stream compute it) with the parameters that shape its output."""
+    digest = hashlib.sha256(content_hash.encode('utf-8'))
+    for name in sorted(params):
+        digest.update(f"\0{name}={params[name]}".encode('utf-8'))
+    return f"{kind}:{digest.hexdigest()}"
+
+def _delete_entry(entry):
+    if entry.get('blob_id'):
+        fs_cache.delete(entry['blob_id'])
+    cache_collection.delete_one({'_id': entry['_id']})
+
+def _lookup(key):
+    entry = cache_collection.find_one_and_update(
+        {'key': key},
+        {'$set': {'last_used': _now()}, '$inc': {'hits': 1}}
+    )
+    if not entry:
+        return None
+    expires_at = entry['expires_at']
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    if expires_at <= _now():
+        _delete_entry(entry)
+        return None
+    return entry
+
+def get_report(key):
+    """Return the cached ZIP bytes for key, or None on a miss."""
+    entry = _lookup(key)
+    if not entry:
+        return None
+    try:
+        return fs_cache.get(entry['blob_id']).read()
+    except gridfs.errors.NoFile:
+        _delete_entry(entry)
+        return None
+
+def get_charts(key, available=None):
+    """Return the cached chart filename list for key, or None on a miss.
+
+    If available(filenames) is given and false (charts since collected), the
+    entry is dropped and reported as a miss.
+    """
+    entry = _lookup(key)
+    if not entry:
+        return None
+    if available and not available(entry['chart_filenames']):
+        _delete_entry(entry)
+        return None
+    return entry['chart_filenames']
+
+def _store(key, fields, size):
+    _ensure_indexes()
+    now = _now()
+    try:
+        cache_collection.insert_one({
+            'key': key,
+            'size': size,
+            'hits': 0,
+            'created_at': now,
+            'last_used': now,
+            'expires_at': now + timedelta(seconds=RESULT_CACHE_TTL_SECONDS),
+            **fields
+        })
+    except DuplicateKeyError:
+        # Another worker cached the same result first
+        if fields.get('blob_id'):
+            fs_cache.delete(fields['blob_id'])
+    evict()
+
+def put_report(key, zip_bytes):
+    blob_id = fs_cache.put(zip_bytes, filename=f"{key}.zip", content_type='application/zip')
+    _store(key, {'blob_id': blob_id}, len(zip_bytes))
+
+def report_writer(key):
+    """Open a GridFS file to write a report ZIP into piece by piece; finish with commit_report or abort()."""
+    return fs_cache.new_file(filename=f"{key}.zip", content_type='application/zip')
+
+def commit_report(key, grid_in):
+    grid_in.close()
+    _store(key, {'blob_id': grid_in._id}, grid_in.length)
+
+def put_charts(key, chart_filenames):
+    _store(key, {'chart_filenames': list(chart_filenames)}, 0)
+
+def get_chart_data(key):
+    """Return (gzipped JSON, etag) cached for key, or None on a miss."""
+    entry = _lookup(key)
+    if not entry:
+        return None
+    return bytes(entry['chart_data']), entry['etag']
+
+def put_chart_data(key, gzipped, etag):
+    _store(key, {'chart_data': Binary(gzipped), 'etag': etag}, len(gzipped))
+
+def evict():
+    """Drop expired entries, then least recently used ones until under the size bound."""
+    for entry in cache_collection.find({'expires_at': {'$lte': _now()}}):
+        _delete_entry(entry)
+
+    totals = list(cache_collection.aggregate([{'$group': {'_id': None, 'size': {'$sum': '$size'}}}]))
+    total = totals[0]['size'] if totals else 0
+    if total <= RESULT_CACHE_MAX_BYTES:
+        return
+    for entry in cache_collection.find({}).sort('last_used', ASCENDING):
+        _delete_entry(entry)
+        total -= entry['size']
+        if total <= RESULT_CACHE_MAX_BYTES:
+            break
@@ -0,0 +1,172 @@
+"""
+Single-parse reader for uploaded spreadsheets.
+
+The format is sniffed from the first bytes (zip container = xlsx, OLE2 = xls,
+anything else is treated as delimited text) with the extension only as a
+tie-breaker, so each upload goes straight to the right parser instead of
+failing an Excel parse before falling back to CSV. CSVs use pandas' pyarrow
+engine when pyarrow is installed. `usecols` and `dtype` are applied by the
+parser itself, so unneeded columns are never decoded.
+"""
+import os, csv
+from io import BytesIO
+import pandas as pd
+from openpyxl import load_workbook
+
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+XLSX_MAGIC = b'PK\x03\x04'
+XLS_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+EXCEL_EXTENSIONS = {'.xlsx': 'xlsx', '.xlsm': 'xlsx', '.xls': 'xls'}
+
+def _open(source):
+    """Return (fileobj, should_close) for bytes, a path or an open binary file."""
+    if isinstance(source, (bytes, bytearray)):
+        return BytesIO(source), True
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb'), True
+    return source, False
+
+def sniff_format(fileobj, filename=None):
+    """'xlsx', 'xls' or 'csv', from the magic bytes; the file position is left unchanged."""
+    pos = fileobj.tell()
+    head = fileobj.read(8)
+    fileobj.seek(pos)
+    if head.startswith(XLSX_MAGIC):
+        return 'xlsx'
+    if head.startswith(XLS_MAGIC):
+        return 'xls'
+    if not head and filename:
+        return EXCEL_EXTENSIONS.get(os.path.splitext(filename)[1].lower(), 'csv')
+    return 'csv'
+
+def sniff_upload(source, filename=None):
+    """(format, size in bytes) of an upload given as bytes, a path or a seekable binary file."""
+    fileobj, should_close = _open(source)
+    try:
+        pos = fileobj.tell()
+        fmt = sniff_format(fileobj, filename)
+        size = fileobj.seek(0, os.SEEK_END) - pos
+        fileobj.seek(pos)
+        return fmt, size
+    finally:
+        if should_close:
+            fileobj.close()
+
+def _csv_header(fileobj):
+    pos = fileobj.tell()
+    line = fileobj.readline().decode('utf-8-sig', errors='replace')
+    fileobj.seek(pos)
+    return next(csv.reader([line]), [])
+
+def _read_csv(fileobj, usecols=None, dtype=None):
+    header = _csv_header(fileobj)
+    kwargs = {}
+    # pandas' pyarrow engine cannot rename blank or repeated headers the way the C engine does
+    if CSV_ENGINE == 'pyarrow' and all(header) and len(set(header)) == len(header):
+        kwargs['engine'] = 'pyarrow'
+        if usecols is not None:
+            kwargs['usecols'] = [col for col in header if col in usecols]
+    elif usecols is not None:
+        kwargs['usecols'] = lambda col: col in usecols
+    if dtype:
+        kwargs['dtype'] = {col: t for col, t in dtype.items() if col in header}
+    return pd.read_csv(fileobj, **kwargs)
+
+def _read_excel(fileobj, fmt, usecols=None, dtype=None):
+    kwargs = {'engine': 'openpyxl' if fmt == 'xlsx' else None}
+    if usecols is not None:
+        kwargs['usecols'] = lambda col: col in usecols
+    if dtype:
+        kwargs['dtype'] = dtype
+    return pd.read_excel(fileobj, **kwargs)
+
+def read_spreadsheet(source, filename=None, usecols=None, dtype=None):
+    """
+    Parse an upload (bytes, path or binary file object) exactly once.
+
+    usecols limits the columns that are decoded; dtype maps column names to
+    compact dtypes applied at read time. Raises ValueError if the file cannot
+    be parsed.
+    """
+    fileobj, should_close = _open(source)
+    usecols = set(usecols) if usecols is not None else None
+    try:
+        start = fileobj.tell()
+        fmt = sniff_format(fileobj, filename)
+        read = _read_csv if fmt == 'csv' else lambda f, cols, types: _read_excel(f, fmt, cols, types)
+        try:
+            return read(fileobj, usecols, dtype)
+        except (ValueError, TypeError) as e:
+            if not dtype:
+                raise ValueError(f"Error reading uploaded file: {e}") from e
+            # A column the profile called numeric did not fit its compact dtype; read as inferred
+            fileobj.seek(start)
+            return read(fileobj, usecols, None)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Error reading uploaded file: {e}") from e
+    finally:
+        if should_close:
+            fileobj.close()
+
+def iter_csv_chunks(source, chunksize, dtype=None):
+    """Yield a CSV upload as DataFrames of up to chunksize rows (C engine: pyarrow's cannot chunk).
+
+    Each chunk's dtypes are inferred on their own; pass dtype for columns
+    that must read the same in every chunk.
+    """
+    fileobj, should_close = _open(source)
+    try:
+        with pd.read_csv(fileobj, chunksize=chunksize, dtype=dtype) as reader:
+            yield from reader
+    finally:
+        if should_close:
+            fileobj.close()
+
+def _dedupe_headers(values):
+    # Name blank and repeated headers the way pandas does ('Unnamed: 3', 'Q.1')
+    headers, seen = [], {}
+    for i, value in enumerate(values):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == '' else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        headers.append(name)
+    return headers
+
+def read_headers(source, filename=None):
+    """Read only the header row of an upload (bytes, a path or a seekable file object such as a GridOut).
+
+    A file object is left at the position it was passed in at.
+    """
+    fileobj, should_close = _open(source)
+    pos = fileobj.tell()
+    try:
+        fmt = sniff_format(fileobj, filename)
+        if fmt == 'csv':
+            return [str(col) for col in pd.read_csv(fileobj, nrows=0).columns]
+        if fmt == 'xls':
+            return [str(col) for col in pd.read_excel(fileobj, nrows=0).columns]
+        # Streaming workbook reader: only the zip directory and the first sheet's first row are read
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            first_row = next(workbook.worksheets[0].iter_rows(min_row=1, max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+        values = list(first_row)
+        while values and values[-1] is None:
+            values.pop()
+        return _dedupe_headers(values)
+    finally:
+        if should_close:
+            fileobj.close()
+        else:
+            fileobj.seek(pos)
@@ -0,0 +1,106 @@
+"""
+Suggestion summarizer backends.
+
+'gemini' sends the suggestions to the LLM (see feedback_processor); 'local'
+is the extractive summarizer below, which reads every suggestion in a group,
+needs no network and runs in milliseconds.
+"""
+import os, re, math
+from collections import Counter, defaultdict
+
+SUMMARIZER_BACKENDS = ['gemini', 'local']
+DEFAULT_SUMMARIZER = os.environ.get('SUMMARIZER_BACKEND', 'gemini')
+
+STOPWORDS = set("""
+a about above after again all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or other our
+ours out over own same she should so some such than that the their theirs them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would you
+your yours please maybe should shall may might must us get got lot lots really much many make made thanks thank
+""".split())
+
+# Whole answers that carry no suggestion
+EMPTY_ANSWERS = {'nil', 'na', 'n a', 'none', 'no', 'nothing', 'no suggestions', 'no suggestion', 'nope', 'ok', 'good', '-'}
+
+DUPLICATE_SIMILARITY = 0.8
+REDUNDANT_SIMILARITY = 0.5
+
+def _tokens(text):
+    return [t for t in re.findall(r"[a-z0-9']+", text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def _collapse_duplicates(suggestions):
+    """Group near-identical suggestions; returns [(text, token_set, count)] by first appearance."""
+    clusters = []
+    exact = {}
+    postings = defaultdict(list)
+    for text in suggestions:
+        tokens = _tokens(text)
+        if not tokens:
+            continue
+        key = ' '.join(tokens)
+        if key in exact:
+            clusters[exact[key]][2] += 1
+            continue
+        token_set = set(tokens)
+        candidates = Counter(i for t in token_set for i in postings[t])
+        match = None
+        for i, shared in candidates.most_common():
+            # Too few shared tokens here (and in every later candidate) to reach the threshold
+            if shared < DUPLICATE_SIMILARITY * len(token_set):
+                break
+            if _jaccard(token_set, clusters[i][1]) >= DUPLICATE_SIMILARITY:
+                match = i
+                break
+        if match is not None:
+            clusters[match][2] += 1
+            exact[key] = match
+            continue
+        exact[key] = len(clusters)
+        for t in token_set:
+            postings[t].append(len(clusters))
+        clusters.append([text.strip(), token_set, 1])
+    return clusters
+
+def summarize_local(suggestions, max_points=5, max_keywords=8):
+    """Extractive summary: TF-IDF ranked, de-duplicated suggestions plus keywords."""
+    suggestions = [str(s) for s in suggestions
+                   if str(s).strip() and str(s).strip().lower().strip('.!') not in EMPTY_ANSWERS]
+    clusters = _collapse_duplicates(suggestions)
+    if not clusters:
+        return "No suggestions provided."
+
+    # Document frequency over distinct suggestions; each cluster's weight is its size
+    n_docs = len(clusters)
+    df_counts = Counter(t for _, token_set, _ in clusters for t in token_set)
+    idf = {t: math.log((1 + n_docs) / (1 + count)) + 1 for t, count in df_counts.items()}
+
+    keyword_scores = Counter()
+    scored = []
+    for text, token_set, count in clusters:
+        term_weights = [idf[t] for t in token_set]
+        # Mean TF-IDF keeps long answers from winning on length alone; log(count)
+        # lifts points many students raised
+        score = (sum(term_weights) / len(term_weights)) * (1 + math.log(count))
+        scored.append((score, text, token_set, count))
+        for t in token_set:
+            keyword_scores[t] += idf[t] * count
+
+    points = []
+    for score, text, token_set, count in sorted(scored, key=lambda item: -round(item[0], 6)):
+        if any(_jaccard(token_set, chosen) >= REDUNDANT_SIMILARITY for _, chosen, _ in points):
+            continue
+        points.append((text, token_set, count))
+        if len(points) == max_points:
+            break
+
+    ranked = sorted(keyword_scores.items(), key=lambda item: (-round(item[1], 6), item[0]))
+    keywords = [t for t, _ in ranked[:max_keywords]]
+    lines = [f"Based on {len(suggestions)} suggestions ({n_docs} distinct).",
+             f"Key themes: {', '.join(keywords)}.", "Representative suggestions:"]
+    for text, _, count in points:
+        lines.append(f"- {text}" + (f" (raised {count} times)" if count > 1 else ""))
+    return "\n".join(lines)
@@ -0,0 +1,163 @@
+"""
+Timed spans and Prometheus metrics.
+
+`span(name, **attrs)` times a block: the duration goes into the
+`feedback_span_seconds{span=...}` histogram and, during a request, into
+that request's trace, which can be returned as a Server-Timing header.
+Attributes (rows, groups, charts, bytes, ...) can be given up front or
+added with `.set()` once known. MongoDB commands are timed by a pymongo
+command listener registered when this module is imported, so it must be
+imported before any MongoClient is created.
+
+Metrics live in the process that records them: spans from report worker
+processes or the job pool are not part of the web process's /metrics.
+"""
+import time, threading, contextvars
+from contextlib import contextmanager
+from pymongo import monitoring
+
+# Seconds; the last bucket is +Inf
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+_trace = contextvars.ContextVar('trace', default=None)
+_lock = threading.Lock()
+_histograms = {}  # (metric, labels) -> [bucket counts..., sum, count]
+_counters = {}  # (metric, labels) -> value
+_help = {
+    'feedback_request_seconds': ('histogram', 'HTTP request latency (until the response starts)'),
+    'feedback_requests_total': ('counter', 'HTTP requests'),
+    'feedback_span_seconds': ('histogram', 'Duration of pipeline stages, MongoDB commands and Gemini calls'),
+    'feedback_span_errors_total': ('counter', 'Spans that ended with an exception'),
+}
+
+def _labels(**labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def observe(metric, seconds, **labels):
+    key = (metric, _labels(**labels))
+    with _lock:
+        values = _histograms.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+def increment(metric, amount=1, **labels):
+    key = (metric, _labels(**labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.seconds = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+def _finish(record, seconds, failed=False):
+    record.seconds = seconds
+    observe('feedback_span_seconds', seconds, span=record.name)
+    if failed:
+        increment('feedback_span_errors_total', span=record.name)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append(record)
+
+@contextmanager
+def span(name, **attrs):
+    """Time the block as a span called name; yields the Span so attributes can be added."""
+    record = Span(name, attrs)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        _finish(record, time.perf_counter() - start, failed=True)
+        raise
+    _finish(record, time.perf_counter() - start)
+
+def start_trace():
+    """Collect the spans of the current request (or job) from here on; returns the token for end_trace."""
+    return _trace.set([])
+
+def end_trace(token):
+    trace = _trace.get()
+    _trace.reset(token)
+    return trace or []
+
+def summarize(trace):
+    """{span name: {'ms', 'count', numeric attributes summed}} for a trace."""
+    totals = {}
+    for record in trace:
+        total = totals.setdefault(record.name, {'ms': 0.0, 'count': 0})
+        total['ms'] += record.seconds * 1000
+        total['count'] += 1
+        for key, value in record.attrs.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    for total in totals.values():
+        total['ms'] = round(total['ms'], 1)
+    return totals
+
+def server_timing(trace):
+    """Server-Timing header value for a trace, one entry per span name."""
+    entries = []
+    for name, total in summarize(trace).items():
+        desc = " ".join([f"x{total['count']}"] + [f"{key}={value}" for key, value in total.items()
+                                                  if key not in ('ms', 'count')])
+        entries.append(f'{name.replace(".", "-")};dur={total["ms"]};desc="{desc}"')
+    return ", ".join(entries)
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {key: list(values) for key, values in _histograms.items()}
+        counters = dict(_counters)
+    lines = []
+    for metric, (kind, text) in _help.items():
+        lines += [f"# HELP {metric} {text}", f"# TYPE {metric} {kind}"]
+        if kind == 'counter':
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+            continue
+        for (name, labels), values in sorted(histograms.items()):
+            if name != metric:
+                continue
+            for bound, count in zip(LATENCY_BUCKETS, values):
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {values[-2]:.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {values[-1]}")
+    return "\n".join(lines) + "\n"
+
+class _MongoCommandTimer(monitoring.CommandListener):
+    # Commands run on the calling thread, so spans land in that request's trace
+    def __init__(self):
+        self._started = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._started[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else None
+
+    def _end(self, event, failed):
+        collection = self._started.pop((event.connection_id, event.request_id), None)
+        attrs = {'collection': collection} if collection else {}
+        _finish(Span(f"mongo.{event.command_name}", attrs), event.duration_micros / 1e6, failed)
+
+    def succeeded(self, event):
+        self._end(event, False)
+
+    def failed(self, event):
+        self._end(event, True)
+
+monitoring.register(_MongoCommandTimer())
@@ -0,0 +1,4 @@
+import os, sys
+
+# The server modules are imported flat, as app.py does when run from server/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
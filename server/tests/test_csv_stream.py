@@ -0,0 +1,52 @@
+import pandas as pd
+
+import feedback_processor as fp
+
+CATEGORY_GROUPS = {
+    'Faculty': ['Faculty [Clarity]', 'Faculty [Depth]'],
+    'Facilities': ['Facilities [Labs]'],
+}
+
+def test_streamed_counts_match_in_memory(tmp_path):
+    df = pd.DataFrame({
+        'Branch': ['CS', 'IT', 'CS', 'ME', None, 'IT', 'CS', 'ME', 'IT', 'CS'],
+        'Faculty [Clarity]': [5, 4, '', 3, 2, 'Agree', 1, 5, 4.5, 3],
+        'Faculty [Depth]': [1, 2, 3, 4, 5, 6, 0, None, 2, 2],
+        'Facilities [Labs]': [3, 3, 3, '5', 1, 2, None, 4, 4, 5],
+        'Any suggestions?': ['More labs', None, 'Wifi', 'Longer hours', 'Fans', None, 'Projectors', None, 'Wifi', 'Nothing'],
+    })
+    path = tmp_path / 'feedback.csv'
+    df.to_csv(path, index=False)
+
+    # Chunks of three rows, so groups and counts are merged across chunks
+    streamed = fp.aggregate_csv_stream(str(path), 'Branch', chunksize=3)
+    in_memory = pd.read_csv(path)
+    expected = fp.compute_likert_histograms(in_memory, CATEGORY_GROUPS, 'Branch')
+    got = streamed.histogram(CATEGORY_GROUPS)
+
+    assert sorted(streamed.groups) == ['CS', 'IT', 'ME']
+    for group in streamed.groups:
+        pd.testing.assert_frame_equal(fp.histogram_for_group(got, group), fp.histogram_for_group(expected, group),
+                                      check_dtype=False)
+    assert sorted(streamed.samples['CS']) == ['More labs', 'Nothing', 'Projectors', 'Wifi']
+
+def test_group_dtype_changing_between_chunks(tmp_path):
+    # The first chunk's branches are all numbers, the second's are mixed
+    df = pd.DataFrame({
+        'Branch': ['2', '2', '3', '2', 'IT', '3'],
+        'Faculty [Clarity]': [5, 4, 3, 2, 1, 5],
+        'Faculty [Depth]': [1, 2, 3, 4, 5, 4],
+        'Facilities [Labs]': [3, 3, 3, 5, 1, 2],
+        'Any suggestions?': [1, 2, 3, 'More labs', 'Wifi', 4],
+    })
+    path = tmp_path / 'feedback.csv'
+    df.to_csv(path, index=False)
+
+    streamed = fp.aggregate_csv_stream(str(path), 'Branch', chunksize=3)
+    assert sorted(streamed.groups) == ['2', '3', 'IT']
+    assert sorted(streamed.samples['2']) == ['1', '2', 'More labs']
+    expected = fp.compute_likert_histograms(pd.read_csv(path, dtype={'Branch': str}), CATEGORY_GROUPS, 'Branch')
+    got = streamed.histogram(CATEGORY_GROUPS)
+    for group in streamed.groups:
+        pd.testing.assert_frame_equal(fp.histogram_for_group(got, group), fp.histogram_for_group(expected, group),
+                                      check_dtype=False)
@@ -0,0 +1,112 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from gemini_client import GeminiClient, GeminiUnavailable
+
+class ResourceExhausted(Exception):
+    """Named like the google.api_core rate-limit error the client retries."""
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel: replays a script of results, errors and delays."""
+    def __init__(self, *script, delay=0.0):
+        self.script = list(script)
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            step = self.script.pop(0) if self.script else f"answer to {prompt}"
+        try:
+            time.sleep(self.delay)
+            if isinstance(step, Exception):
+                raise step
+            return SimpleNamespace(text=f"  {step}\n")
+        finally:
+            with self._lock:
+                self.active -= 1
+
+def client(model, **kwargs):
+    kwargs.setdefault('backoff', 0)
+    return GeminiClient(model, **kwargs)
+
+def test_returns_stripped_text():
+    assert client(FakeModel('hello')).generate('hi') == 'hello'
+
+def test_retries_rate_limits_then_succeeds():
+    model = FakeModel(ResourceExhausted('quota'), ResourceExhausted('quota'), 'ok')
+    assert client(model, max_retries=3).generate('hi') == 'ok'
+    assert model.calls == 3
+
+def test_gives_up_after_max_retries():
+    model = FakeModel(*[ResourceExhausted('quota')] * 5)
+    with pytest.raises(GeminiUnavailable):
+        client(model, max_retries=2).generate('hi')
+    assert model.calls == 3
+
+def test_other_errors_are_not_retried():
+    model = FakeModel(ValueError('bad request'))
+    with pytest.raises(GeminiUnavailable, match='bad request'):
+        client(model, max_retries=3).generate('hi')
+    assert model.calls == 1
+
+def test_call_past_its_deadline_times_out():
+    started = time.monotonic()
+    with pytest.raises(GeminiUnavailable, match='timed out'):
+        client(FakeModel('late', delay=1.0), timeout=0.05, max_retries=0).generate('hi')
+    assert time.monotonic() - started < 0.5
+
+def test_breaker_opens_then_half_opens():
+    model = FakeModel(ValueError('down'), ValueError('down'), 'back', ValueError('down'))
+    gemini = client(model, failure_threshold=2, reset_after=0.1)
+    for _ in range(2):
+        with pytest.raises(GeminiUnavailable):
+            gemini.generate('hi')
+
+    # Open: calls fail without reaching the model
+    with pytest.raises(GeminiUnavailable, match='circuit breaker is open'):
+        gemini.generate('hi')
+    assert model.calls == 2
+
+    # Half-open after reset_after: a success closes it again
+    time.sleep(0.15)
+    assert gemini.generate('hi') == 'back'
+    assert gemini._opened_at is None and gemini._failures == 0
+
+    # A failure while closed only counts towards the threshold
+    with pytest.raises(GeminiUnavailable):
+        gemini.generate('hi')
+    assert gemini._opened_at is None
+
+def test_half_open_failure_reopens():
+    model = FakeModel(ValueError('down'), ValueError('still down'))
+    gemini = client(model, failure_threshold=1, reset_after=0.1)
+    with pytest.raises(GeminiUnavailable):
+        gemini.generate('hi')
+    time.sleep(0.15)
+    with pytest.raises(GeminiUnavailable, match='still down'):
+        gemini.generate('hi')
+    with pytest.raises(GeminiUnavailable, match='circuit breaker is open'):
+        gemini.generate('hi')
+    assert model.calls == 2
+
+def test_generate_many_caps_concurrency_and_keeps_order():
+    class PerPrompt(FakeModel):
+        def generate_content(self, prompt):
+            response = super().generate_content(prompt)
+            if prompt == '2':
+                raise ValueError('bad')
+            return response
+
+    model = PerPrompt(delay=0.05)
+    results = client(model, max_concurrency=2, max_retries=0).generate_many(list('123456'))
+    assert results == ['answer to 1', None, 'answer to 3', 'answer to 4', 'answer to 5', 'answer to 6']
+    assert model.peak == 2
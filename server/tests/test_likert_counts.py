@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+import feedback_processor as fp
+
+CATEGORY_GROUPS = {
+    'Faculty': ['Faculty [Clarity]', 'Faculty [Depth]'],
+    'Facilities': ['Facilities [Library]', 'Facilities [Labs]'],
+}
+
+def baseline_summary_table(sub_df, category_cols, feedback_type='stakeholder'):
+    # generate_summary_table as it was before the histogram rewrite, kept as the reference
+    summary = {}
+    for col in category_cols:
+        if col in sub_df.columns:
+            if feedback_type == 'stakeholder':
+                scores = pd.to_numeric(sub_df[col], errors='coerce').dropna()
+                scores = scores[scores.between(1, 5)].astype(int).value_counts().to_dict()
+                summary[fp.extract_bracket_content(col)] = {i: scores.get(i, 0) for i in range(1, 6)}
+            else:
+                cleaned = pd.to_numeric(sub_df[col], errors='coerce').dropna().astype(int)
+                if cleaned.empty:
+                    continue
+                score_counts = cleaned.value_counts().to_dict()
+                summary[col] = {i: score_counts.get(i, 0) for i in range(1, 6)}
+
+    if not summary:
+        return pd.DataFrame()
+
+    score_df = pd.DataFrame(summary).T.fillna(0).astype(int)
+    score_df["Total"] = score_df[[5, 4, 3, 2, 1]].sum(axis=1)
+    for i in range(5, 0, -1):
+        score_df[f"% of {i}"] = score_df.apply(
+            lambda row: round(row[i] * 100 / row["Total"], 2) if row["Total"] > 0 else 0, axis=1
+        )
+    score_df = score_df.reset_index().rename(columns={"index": "Category"})
+    return score_df[["Category", "Total", 5, "% of 5", 4, "% of 4", 3, "% of 3", 2, "% of 2", 1, "% of 1"]]
+
+@pytest.fixture
+def answers():
+    # Numbers, numeric strings, blanks, text, out-of-range and fractional answers side by side
+    return pd.DataFrame({
+        'Branch': ['CS', 'CS', 'CS', 'IT', 'IT', 'IT', 'ME', None],
+        'Faculty [Clarity]': [5, '4', ' 3 ', '', None, 'Agree', 2.5, 1],
+        'Faculty [Depth]': [0, 6, 7, -1, 5.0, 4.9, '3.0', 2],
+        'Facilities [Library]': [None, None, None, None, None, None, None, None],
+        'Facilities [Labs]': ['5', '5', 'n/a', 1.2, 3, 3, 4, 4],
+    })
+
+@pytest.mark.parametrize('feedback_type', ['stakeholder', 'subject'])
+def test_summary_table_matches_baseline(answers, feedback_type):
+    histogram = fp.compute_likert_histograms(answers, CATEGORY_GROUPS, 'Branch')
+    for value, group_df in answers.groupby('Branch'):
+        for cols in CATEGORY_GROUPS.values():
+            expected = baseline_summary_table(group_df, cols, feedback_type)
+            direct = fp.generate_summary_table(group_df, cols, feedback_type)
+            counted = fp.generate_summary_table(group_df, cols, feedback_type, fp.histogram_for_group(histogram, value))
+            if expected.empty:
+                assert direct.empty and counted.empty
+                continue
+            pd.testing.assert_frame_equal(direct, expected, check_dtype=False)
+            pd.testing.assert_frame_equal(counted, expected, check_dtype=False)
+
+def test_likert_codes_buckets(answers):
+    codes = fp.likert_codes(answers, ['Faculty [Clarity]'])
+    # 1-5 as themselves, blanks and text as 0, fractions truncated like astype(int)
+    assert codes[:, 0].tolist() == [5, 4, 3, 0, 0, 0, 2, 1]
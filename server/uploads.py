@@ -0,0 +1,156 @@
+"""
+Stored uploads.
+
+Spreadsheets are streamed into the `files` GridFS bucket once and then
+referred to by file_id: report, chart and job requests load the stored data
+server-side instead of having the client send the file again.
+
+The `files` collection has one document per (file_id, filename); a
+filename looks up its newest upload, and re-uploading a name never touches
+the blob an earlier file_id points at. A background sweep deletes uploads
+superseded under their filename for longer than UPLOAD_RETENTION_SECONDS
+that no queued or running job refers to, then any blob, columnar copy and
+profile nothing refers to any more.
+"""
+import os, time, hashlib, threading
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import MongoClient, DESCENDING
+import gridfs
+import columnar_store, dataset_profile
+
+# MongoDB setup
+client = MongoClient('mongodb://localhost:27017/')
+db = client['feedback_db']
+files_collection = db['files']
+fs_files = gridfs.GridFS(db, collection='files')
+
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(500 * 1024 * 1024)))
+UPLOAD_RETENTION_SECONDS = int(os.environ.get('UPLOAD_RETENTION_SECONDS', str(7 * 24 * 3600)))
+UPLOAD_SWEEP_INTERVAL_SECONDS = int(os.environ.get('UPLOAD_SWEEP_INTERVAL_SECONDS', '3600'))
+
+_indexes_ready = False
+_sweeper = None
+
+def _ensure_indexes():
+    global _indexes_ready
+    if not _indexes_ready:
+        files_collection.create_index('filename')
+        files_collection.create_index('sha256')
+        files_collection.create_index('file_id')
+        files_collection.create_index('uploaded_at')
+        _indexes_ready = True
+
+def find_file_meta(filename):
+    """The `files` document of the newest upload called filename, or None."""
+    _ensure_indexes()
+    return files_collection.find_one({'filename': filename}, sort=[('uploaded_at', DESCENDING)])
+
+def record_upload(meta):
+    """Save meta as the `files` document of (meta['file_id'], meta['filename'])."""
+    _ensure_indexes()
+    _start_sweeper()
+    files_collection.update_one({'file_id': meta['file_id'], 'filename': meta['filename']}, {'$set': meta}, upsert=True)
+
+def get_upload(file_id):
+    """The `files` document of a stored upload, or None for an unknown or malformed id."""
+    try:
+        oid = ObjectId(file_id)
+    except (InvalidId, TypeError):
+        return None
+    _ensure_indexes()
+    meta = files_collection.find_one({'file_id': oid}, sort=[('uploaded_at', DESCENDING)])
+    return meta if meta and fs_files.exists(oid) else None
+
+def open_upload(meta):
+    """A seekable, lazily fetched file object over the stored bytes."""
+    return fs_files.get(meta['file_id'])
+
+class UploadTooLarge(Exception):
+    pass
+
+def write_stream(grid_fs, stream, filename, content_type, **metadata):
+    """Copy a binary stream into a GridFS bucket one chunk at a time, hashing it on the way.
+
+    Returns (file_id, sha256, size); raises UploadTooLarge past MAX_UPLOAD_BYTES.
+    """
+    digest = hashlib.sha256()
+    grid_in = grid_fs.new_file(filename=filename, content_type=content_type, **metadata)
+    size = 0
+    try:
+        while True:
+            chunk = stream.read(grid_in.chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise UploadTooLarge(f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit")
+            digest.update(chunk)
+            grid_in.write(chunk)
+    except BaseException:
+        grid_in.abort()
+        raise
+    grid_in.close()
+    return grid_in._id, digest.hexdigest(), size
+
+def hash_stream(stream, chunk_size=1024 * 1024):
+    """SHA-256 of a seekable binary stream, read in chunks; the stream is rewound to where it was."""
+    digest = hashlib.sha256()
+    start = stream.tell()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(start)
+    return digest.hexdigest()
+
+def store_upload(stream, filename, content_type):
+    """Stream an upload into GridFS one chunk at a time, hashing it on the way.
+
+    Returns (file_id, sha256, size, duplicate). When a blob with the same
+    SHA-256 is already stored the new copy is dropped and the existing
+    file_id returned. Raises UploadTooLarge past MAX_UPLOAD_BYTES.
+    """
+    file_id, sha256, size = write_stream(fs_files, stream, filename, content_type)
+
+    _ensure_indexes()
+    existing = files_collection.find_one({'sha256': sha256, 'file_id': {'$ne': file_id}})
+    if existing and fs_files.exists(existing['file_id']):
+        fs_files.delete(file_id)
+        return existing['file_id'], sha256, size, True
+    return file_id, sha256, size, False
+
+def sweep_uploads():
+    """Delete uploads superseded for longer than the retention and not used by a job; returns how many."""
+    _ensure_indexes()
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=UPLOAD_RETENTION_SECONDS)
+    in_use = {str(file_id) for file_id in db['jobs'].distinct('file_id', {'status': {'$in': ['queued', 'running']}})}
+    deleted = 0
+    for doc in files_collection.find({'uploaded_at': {'$lt': cutoff}}):
+        newest = find_file_meta(doc['filename'])
+        if (newest and newest['_id'] == doc['_id']) or str(doc['file_id']) in in_use:
+            continue
+        files_collection.delete_one({'_id': doc['_id']})
+        deleted += 1
+        if not files_collection.find_one({'file_id': doc['file_id']}, {'_id': 1}):
+            fs_files.delete(doc['file_id'])
+        # Nothing stored has this content any more: its columnar copy and profile go too
+        if doc.get('sha256') and not files_collection.find_one({'sha256': doc['sha256']}, {'_id': 1}):
+            columnar_store.delete_columnar(doc['sha256'])
+            dataset_profile.delete_profile(doc['sha256'])
+    if deleted:
+        print(f"Upload sweep deleted {deleted} superseded uploads")
+    return deleted
+
+def _sweep_forever():
+    while True:
+        try:
+            sweep_uploads()
+        except Exception as e:
+            print(f"Upload sweep failed: {e}")
+        time.sleep(UPLOAD_SWEEP_INTERVAL_SECONDS)
+
+def _start_sweeper():
+    global _sweeper
+    if _sweeper is None and UPLOAD_SWEEP_INTERVAL_SECONDS > 0:
+        _sweeper = threading.Thread(target=_sweep_forever, name='upload-sweep', daemon=True)
+        _sweeper.start()